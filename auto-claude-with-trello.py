@@ -13,6 +13,14 @@ Environment Variables Required:
 - BITBUCKET_REPO_SLUG: Your repository name
 - GIT_REPO_PATH: Path to your git repository (e.g., /path/to/your/repo)
 - WORKFLOW_STATE_DIR: Directory to store workflow state (optional, defaults to ~/.trello-workflow)
+- PR_COMMENT_BATCH_THRESHOLD: Number of new PR comments from which they are handled together (optional, defaults to 2)
+- MAX_CARD_WORKERS: Number of cards processed concurrently, each in its own worktree (optional, defaults to 1)
+
+Webhook mode (--webhook) additionally uses:
+- WEBHOOK_PORT: Port for the webhook receiver (optional, defaults to 8080)
+- WEBHOOK_CALLBACK_URL: Public base URL of the receiver; webhooks are registered on startup if set
+- TRELLO_WEBHOOK_SECRET: Trello application secret used to verify webhook signatures (optional)
+- BITBUCKET_WEBHOOK_SECRET: Shared secret used to verify BitBucket webhook signatures (optional)
 
 To create a BitBucket repository access token:
 1. Go to BitBucket → Personal settings → App passwords
@@ -31,14 +39,34 @@ import subprocess
 import time
 import re
 import argparse
+import signal
+import atexit
 import shutil
+import tempfile
 import uuid
+import urllib.parse
+import hmac
+import base64
+import hashlib
+import queue
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from functools import lru_cache
 from typing import Dict, List, Optional, Tuple
-from pathlib import Path
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
 
+# orjson is optional; it is much faster for state files and API payloads
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -52,29 +80,523 @@ BITBUCKET_ACCESS_TOKEN = os.getenv('BITBUCKET_ACCESS_TOKEN')
 BITBUCKET_WORKSPACE = os.getenv('BITBUCKET_WORKSPACE')
 BITBUCKET_REPO_SLUG = os.getenv('BITBUCKET_REPO_SLUG')
 
+# Webhook configuration
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8080'))
+WEBHOOK_CALLBACK_URL = os.getenv('WEBHOOK_CALLBACK_URL')
+TRELLO_WEBHOOK_SECRET = os.getenv('TRELLO_WEBHOOK_SECRET')
+BITBUCKET_WEBHOOK_SECRET = os.getenv('BITBUCKET_WEBHOOK_SECRET')
+
 # Repository and state configuration
 GIT_REPO_PATH = os.getenv('GIT_REPO_PATH')
 if not GIT_REPO_PATH:
     print("ERROR: GIT_REPO_PATH environment variable must be set")
     sys.exit(1)
+# Resolved once, so paths reported by git (which are always resolved) can
+# be compared against it and the state directory with plain string checks
+GIT_REPO_PATH = os.path.realpath(GIT_REPO_PATH)
 
 # State directory - outside of git repo
-WORKFLOW_STATE_DIR = os.getenv('WORKFLOW_STATE_DIR', os.path.expanduser('~/.trello-workflow'))
+WORKFLOW_STATE_DIR = os.path.realpath(os.getenv('WORKFLOW_STATE_DIR', os.path.expanduser('~/.trello-workflow')))
 WORKTREE_BASE_DIR = os.path.join(WORKFLOW_STATE_DIR, 'worktrees')
 CARDS_STATE_DIR = os.path.join(WORKFLOW_STATE_DIR, 'cards')
 ATTACHMENTS_BASE_DIR = os.path.join(WORKFLOW_STATE_DIR, 'attachments')
 
+# Comments fetched per card (Trello's maximum for actions), and the
+# maximum number of sub-requests allowed in one Trello /batch call
+TRELLO_ACTIONS_LIMIT = 1000
+TRELLO_BATCH_LIMIT = 10
+
+# Comment action fields read when checking cards for new instructions
+TRELLO_COMMENT_FIELDS = 'data,date'
+
+# Attachment fields process_attachments reads (url is needed for downloads)
+TRELLO_ATTACHMENT_FIELDS = 'id,name,url,mimeType,bytes'
+
+# Text attachments smaller than this many bytes are included in the prompt
+ATTACHMENT_INLINE_LIMIT = 10000
+
+# Maximum length of a Trello comment
+TRELLO_COMMENT_LIMIT = 16384
+
+# Precompiled patterns for branch names, PR URLs in push output and mentions
+BRANCH_INVALID_CHARS_RE = re.compile(r'[^a-zA-Z0-9\s-]')
+BRANCH_DASHES_RE = re.compile(r'-+')
+# BitBucket (new-PR link or existing PR) and GitHub new-PR links, in one pass
+PR_URL_RE = re.compile(
+    r'https://bitbucket\.org/[^\s]+/pull-requests/(?:new[^\s]*|\d+)'
+    r'|https://github\.com/[^\s]+/pull/new/[^\s]*'
+)
+MENTION_RE = re.compile(r'@\w+')
+
+# Shell script used by commit_and_push; $1 is the commit message
+COMMIT_AND_PUSH_SCRIPT = '''
+add_output=$(git add -A 2>&1)
+# Exit code only: git stops at the first staged difference
+if git diff --cached --quiet; then
+    echo "No changes to commit"
+    exit 0
+fi
+echo "Git add:"
+[ -n "$add_output" ] && echo "$add_output"
+echo "Git commit:"
+git commit -m "$1"
+echo "Git push:"
+# Only set the upstream when missing; writing it locks the shared git config
+if git rev-parse --abbrev-ref @{upstream} >/dev/null 2>&1; then
+    git push 2>&1
+else
+    git push --set-upstream origin 2>&1
+fi
+'''
+
+# Processed comment IDs kept per card before older ones are pruned
+MAX_PROCESSED_IDS = 5000
+
+# BitBucket page size (the API maximum) and the PR comment fields we use
+BITBUCKET_PAGELEN = 100
+PR_COMMENT_FIELDS = ','.join([
+    'next',
+    'size',
+    'pagelen',
+    'values.id',
+    'values.content.raw',
+    'values.user.display_name',
+    'values.user.username',
+    'values.created_on',
+    'values.updated_on',
+    'values.parent.id',
+    'values.inline',
+    'values.deleted'
+])
+
+# PR fields used for lookups, change detection (pr_activity) and logging,
+# for a single PR and for a page of PRs
+PR_ITEM_FIELDS = [
+    'id',
+    'title',
+    'state',
+    'links.html.href',
+    'updated_on',
+    'comment_count',
+    'source.branch.name'
+]
+PR_FIELDS = ','.join(PR_ITEM_FIELDS)
+PR_LIST_FIELDS = ','.join(['next'] + [f'values.{field}' for field in PR_ITEM_FIELDS])
+
+# Seconds between checks in loop mode, by number of consecutive checks that
+# found nothing to do: poll quickly while a card is being worked on and back
+# off on an idle board
+POLL_INTERVALS = [(0, 15), (3, 60), (6, 180), (11, 600)]
+
+# Touched after every worktree cleanup; while it is newer than both the
+# worktree admin directory and WORKTREE_BASE_DIR nothing can have become
+# orphaned, so a restart skips the scan
+CLEANUP_STAMP_FILE = os.path.join(WORKFLOW_STATE_DIR, '.cleanup-stamp')
+
+# Bytes read at a time when streaming an attachment download to disk
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# Maximum number of worktrees updated concurrently
+MAX_GIT_WORKERS = 4
+
+# Maximum time a single Claude Code instruction may run (30 minutes)
+CLAUDE_TIMEOUT = 1800
+
+# Maximum number of idle Claude Code processes kept running between instructions
+CLAUDE_POOL_SIZE = 4
+
+# Number of cards processed concurrently; each card works in its own
+# worktree, so their Claude Code runs can overlap
+MAX_CARD_WORKERS = max(1, int(os.getenv('MAX_CARD_WORKERS', '1')))
+
+# Most recent Claude Code stderr lines kept per instruction
+MAX_CLAUDE_STDERR_LINES = 10000
+
+# New PR comments at or above this count are handled in one Claude Code run
+# with a single commit and reply; below it each comment is handled on its own
+PR_COMMENT_BATCH_THRESHOLD = int(os.getenv('PR_COMMENT_BATCH_THRESHOLD', '2'))
+
+# Branches per BitBucket PR query, keeping the OR-combined q filter well
+# under URL length limits
+BITBUCKET_BRANCH_QUERY_LIMIT = 20
+
+# Maximum number of cards whose Trello/BitBucket data is fetched concurrently
+MAX_FETCH_WORKERS = 8
+
+# Default timeout (seconds) for API requests that don't set their own, so a
+# stalled pooled connection can't hang a polling pass indefinitely
+HTTP_TIMEOUT = 30
+
+
+def json_loads(data):
+    """Parse JSON from bytes or str, using orjson when available."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+# Stdlib encoders used by json_dumps without orjson, keyed by (indent, sort_keys);
+# json.dumps would build a new encoder on every call with these options
+_json_encoders = {}
+
+
+def json_dumps(obj, indent: bool = False, sort_keys: bool = False) -> bytes:
+    """Serialize to JSON bytes, using orjson when available."""
+    if orjson is not None:
+        option = (orjson.OPT_INDENT_2 if indent else 0) | (orjson.OPT_SORT_KEYS if sort_keys else 0)
+        return orjson.dumps(obj, option=option)
+    encoder = _json_encoders.get((indent, sort_keys))
+    if encoder is None:
+        # Non-ASCII is written as UTF-8, like orjson does
+        encoder = _json_encoders[(indent, sort_keys)] = json.JSONEncoder(
+            indent=2 if indent else None,
+            sort_keys=sort_keys,
+            ensure_ascii=False
+        )
+    return encoder.encode(obj).encode()
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter that applies HTTP_TIMEOUT to requests without an explicit timeout."""
+    
+    def send(self, request, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = HTTP_TIMEOUT
+        return super().send(request, **kwargs)
+
+
+class RateLimitRetry(Retry):
+    """Retry that also resends non-idempotent requests rejected with 429.
+    
+    A rate-limited request was not processed, so posting it again cannot
+    create a duplicate comment; other failures of POSTs are still not retried.
+    """
+    
+    def is_retry(self, method, status_code, has_retry_after=False):
+        if status_code == 429 and self.total:
+            return True
+        return super().is_retry(method, status_code, has_retry_after)
+
+
+def create_http_session(headers: Optional[Dict] = None, params: Optional[Dict] = None) -> requests.Session:
+    """Create a pooled HTTP session with keep-alive and retries on transient errors."""
+    session = requests.Session()
+    # Rate limits and server errors are retried with exponential backoff, or
+    # after the Retry-After delay when the API sends one. Only idempotent
+    # methods are retried on server errors, so comments are never posted twice
+    retries = RateLimitRetry(total=5, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504])
+    # Keep enough idle connections for every concurrent fetch worker, so none
+    # of them is discarded and re-established with a new TLS handshake
+    adapter = TimeoutHTTPAdapter(pool_connections=10, pool_maxsize=max(20, MAX_FETCH_WORKERS), max_retries=retries)
+    session.mount('https://', adapter)
+    if headers:
+        session.headers.update(headers)
+    if params:
+        session.params.update(params)
+    return session
+
+
+def prune_processed_ids(processed: set, key=None) -> bool:
+    """Bound a processed-ID set to the newest MAX_PROCESSED_IDS IDs.
+    
+    Comments are listed newest first and PR comment listings stop at the
+    first known ID, so an old ID only matters again if every newer one
+    disappeared. Trello action IDs sort chronologically as strings;
+    BitBucket comment IDs need key=int. Returns True if anything was removed.
+    """
+    if len(processed) <= MAX_PROCESSED_IDS:
+        return False
+    keep = set(sorted(processed, key=key, reverse=True)[:MAX_PROCESSED_IDS])
+    processed &= keep
+    return True
+
+
+@lru_cache(maxsize=1024)
+def slugify_branch(card_name: str) -> str:
+    """Turn a card name into a lowercase, dash-separated branch name segment."""
+    branch = BRANCH_INVALID_CHARS_RE.sub('', card_name)
+    branch = branch.replace(' ', '-').lower()
+    return BRANCH_DASHES_RE.sub('-', branch)
+
+
+def pr_comment_details(comment: Dict) -> Dict:
+    """Extract the fields of a BitBucket PR comment used in prompts and replies."""
+    user = comment.get('user') or {}
+    parent = comment.get('parent') or {}
+    inline = comment.get('inline') or {}
+    return {
+        'comment_id': str(comment['id']),
+        'comment_text': comment.get('content', {}).get('raw', ''),
+        'author_display_name': user.get('display_name', 'Unknown'),
+        'author_username': user.get('username', 'unknown'),
+        'created_on': comment.get('created_on', ''),
+        'updated_on': comment.get('updated_on', ''),
+        'parent_id': parent.get('id'),
+        'inline_path': inline.get('path'),
+        'inline_from': inline.get('from'),
+        'inline_to': inline.get('to'),
+    }
+
+
+def pr_comment_context(d: Dict) -> str:
+    """Format a PR comment as instruction context for Claude Code."""
+    lines = [
+        "BitBucket PR Comment Details:",
+        f"- Author: {d['author_display_name']} (@{d['author_username']})",
+        f"- Created: {d['created_on']}",
+        f"- Updated: {d['updated_on']}",
+        f"- Comment ID: {d['comment_id']}",
+    ]
+    # Optional details get a line only when present
+    if d['parent_id']:
+        lines.append(f"- Parent Comment ID: {d['parent_id']}")
+    if d['inline_path']:
+        lines.append(f"- Inline comment on file: {d['inline_path']}")
+    if d['inline_from']:
+        lines.append(f"- Line range: {d['inline_from']} to {d['inline_to']}")
+    lines += ["", "Comment Text:", d['comment_text'], ""]
+    return '\n'.join(lines)
+
+
+def pr_comment_summary(d: Dict) -> str:
+    """Format a PR comment for the bot's reply."""
+    comment_text = d['comment_text']
+    lines = [
+        f"**Author**: {d['author_display_name']} (@{d['author_username']})",
+        f"**Created**: {d['created_on']}",
+        f"**Comment ID**: {d['comment_id']}",
+    ]
+    if d['parent_id']:
+        lines.append(f"**Reply to**: Comment #{d['parent_id']}")
+    if d['inline_path']:
+        lines.append(f"**File**: {d['inline_path']} (lines {d['inline_from']}-{d['inline_to']})")
+    lines += ["", f"**Comment**: {comment_text[:200]}{'...' if len(comment_text) > 200 else ''}"]
+    return '\n'.join(lines)
+
+
+def pack_comments(texts: List[str], limit: int = TRELLO_COMMENT_LIMIT) -> List[str]:
+    """Join consecutive comment texts into as few comments as fit within limit.
+    
+    A text that is too long on its own is still returned as its own comment.
+    """
+    separator = '\n\n---\n\n'
+    packed = []
+    for text in texts:
+        if packed and len(packed[-1]) + len(separator) + len(text) <= limit:
+            packed[-1] = f"{packed[-1]}{separator}{text}"
+        else:
+            packed.append(text)
+    return packed
+
+
+def trello_unchanged(card: Dict, card_state: Dict) -> bool:
+    """Return True if the card had no Trello activity since it was last processed."""
+    last_activity = card_state.get('trello_last_activity')
+    return bool(last_activity) and card.get('dateLastActivity') == last_activity
+
+
+def pr_activity(pr_data: Dict) -> List:
+    """Return the PR fields that change whenever a comment is added."""
+    return [pr_data.get('updated_on'), pr_data.get('comment_count')]
+
+
+class ClaudeSession:
+    """A long-running Claude Code process that accepts prompts over stdin.
+    
+    Prompts and results are exchanged as stream-json messages, so one process
+    (and its loaded session) serves every instruction for a worktree.
+    """
+    
+    def __init__(self, worktree_path: str, session_id: Optional[str] = None, is_first_interaction: bool = True, debug: bool = False):
+        self.debug = debug
+        cmd = [
+            'claude', '--dangerously-skip-permissions', '-p',
+            '--input-format', 'stream-json',
+            '--output-format', 'stream-json',
+            '--verbose'
+        ]
+        if session_id:
+            if is_first_interaction:
+                # First interaction: create new session with specific ID
+                cmd.extend(['--session-id', session_id])
+            else:
+                # Subsequent interactions: resume existing session
+                cmd.extend(['--resume', session_id])
+        
+        # Run in a session of its own so a Ctrl+C meant for the loop does not
+        # also kill Claude Code halfway through an instruction
+        self.proc = subprocess.Popen(
+            cmd,
+            cwd=worktree_path,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            bufsize=1,
+            start_new_session=True
+        )
+        self.timed_out = False
+        self.interrupted = False
+        
+        # Drain stderr in the background so a chatty process can't block;
+        # only the most recent lines are kept so memory stays bounded
+        self.stderr_lines = deque(maxlen=MAX_CLAUDE_STDERR_LINES)
+        self.stderr_lock = threading.Lock()
+        threading.Thread(target=self._drain_stderr, daemon=True).start()
+    
+    def _drain_stderr(self):
+        for line in self.proc.stderr:
+            with self.stderr_lock:
+                self.stderr_lines.append(line)
+    
+    def is_alive(self) -> bool:
+        return self.proc.poll() is None
+    
+    def send(self, prompt: str, timeout: int) -> Tuple[str, str]:
+        """Send a prompt and wait for its result.
+        
+        Returns the result text and any stderr output since the last prompt.
+        Raises subprocess.TimeoutExpired if no result arrives in time.
+        """
+        def kill():
+            self.timed_out = True
+            self.proc.kill()
+        
+        message = {'type': 'user', 'message': {'role': 'user', 'content': prompt}}
+        result = None
+        watchdog = threading.Timer(timeout, kill)
+        watchdog.start()
+        try:
+            # Write the encoded message straight to the byte stream rather than
+            # decoding it for the text wrapper only to have it re-encoded
+            self.proc.stdin.buffer.write(json_dumps(message))
+            self.proc.stdin.buffer.write(b'\n')
+            self.proc.stdin.buffer.flush()
+            for line in self.proc.stdout:
+                try:
+                    event = json_loads(line)
+                except ValueError:
+                    continue
+                if event.get('type') == 'result':
+                    result = event
+                    break
+                if self.debug:
+                    self.log_event(event)
+        except BrokenPipeError:
+            pass
+        finally:
+            watchdog.cancel()
+        
+        if self.timed_out:
+            self.proc.wait()
+            raise subprocess.TimeoutExpired(self.proc.args, timeout)
+        
+        # An interrupted instruction is unfinished work: raising keeps its
+        # edits from being committed and the comment from being marked done
+        if self.interrupted:
+            self.proc.wait()
+            raise RuntimeError("Claude Code was interrupted")
+        
+        with self.stderr_lock:
+            stderr = ''.join(self.stderr_lines)
+            self.stderr_lines.clear()
+        
+        if result is None:
+            self.proc.wait()
+            stderr += f"\nClaude Code exited with code {self.proc.returncode}"
+            return '', stderr
+        
+        result_text = result.get('result', '')
+        if result.get('is_error'):
+            # Errors such as 'Prompt is too long' are reported in the result
+            stderr += result_text
+        return result_text, stderr
+    
+    def log_event(self, event: Dict):
+        """Print Claude Code's progress as it streams in."""
+        if event.get('type') != 'assistant':
+            return
+        for block in event.get('message', {}).get('content', []):
+            if block.get('type') == 'text':
+                print(f"[DEBUG] Claude: {block.get('text', '')[:200]}")
+            elif block.get('type') == 'tool_use':
+                print(f"[DEBUG] Claude tool: {block.get('name')}")
+    
+    def interrupt(self):
+        """Terminate the process group, e.g. on a second Ctrl+C.
+        
+        The process runs in its own session, so the terminal's SIGINT never
+        reaches it; an instruction waiting in send() fails right away.
+        """
+        self.interrupted = True
+        try:
+            os.killpg(self.proc.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    
+    def close(self):
+        """Close stdin so the process exits, escalating to terminate and kill."""
+        try:
+            self.proc.stdin.close()
+            self.proc.wait(timeout=5)
+            return
+        except (OSError, subprocess.TimeoutExpired):
+            pass
+        self.proc.terminate()
+        try:
+            self.proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+            self.proc.wait()
+
 
 class ExtendedWorkflowAutomation:
     def __init__(self, debug=False):
         self.debug = debug
         self.ensure_directories()
+        self._states = {}
+        self._saved_snapshots = {}
+        # (mtime_ns, card_id) of each state file as last read or written
+        self._state_files = {}
+        self.load_all_states()
+        # Serializes git operations on the shared main repository
+        self.main_repo_lock = threading.Lock()
+        # Set once update_main_repository has fetched from origin this run
+        self._origin_fetched = False
+        # Worktree checkouts started by prepare_worktrees, keyed by card ID
+        self._pending_checkouts = {}
+        # Running Claude Code processes, keyed by worktree path
+        # (least recently used first)
+        self._claude_sessions = OrderedDict()
+        # Guards the process pool; worktrees whose process is running an
+        # instruction are never evicted
+        self._claude_lock = threading.Lock()
+        self._claude_in_use = set()
+        # Set by interrupt_claude_sessions; no new process is started after it
+        self._claude_interrupted = False
+        atexit.register(self.close_claude_sessions)
+        # Replies are posted in the background, in order, while the next
+        # comment is already being worked on; Trello and BitBucket replies
+        # have a thread each so neither waits for the other
+        self._reply_executor = ThreadPoolExecutor(max_workers=1)
+        self._pr_reply_executor = ThreadPoolExecutor(max_workers=1)
+        self._pending_replies = []
+        # Number of instructions sent to Claude Code, so run() can report
+        # whether it did any work
+        self._instructions_run = 0
+        # Attachments of each card, as listed by the last card fetch, and
+        # the prompt context built from them; both are replaced on refetch
+        self._card_attachments = {}
+        self._attachment_contexts = {}
         self.bb_base_url = f"https://api.bitbucket.org/2.0/repositories/{BITBUCKET_WORKSPACE}/{BITBUCKET_REPO_SLUG}"
         self.bb_headers = {
             'Authorization': f'Bearer {BITBUCKET_ACCESS_TOKEN}',
             'Accept': 'application/json',
             'Content-Type': 'application/json'
         } if BITBUCKET_ACCESS_TOKEN else None
+        # Shared sessions so HTTPS connections are reused across calls
+        self.bb_session = create_http_session(headers=self.bb_headers)
+        self.trello_session = create_http_session(params={'key': TRELLO_API_KEY, 'token': TRELLO_TOKEN})
         # Unique identifier for bot-generated comments
         self.bot_signature = "[auto-claude-bot:processed]"
         
@@ -92,23 +614,74 @@ class ExtendedWorkflowAutomation:
         os.makedirs(CARDS_STATE_DIR, exist_ok=True)
         os.makedirs(ATTACHMENTS_BASE_DIR, exist_ok=True)
     
-    def get_card_state_file(self, card_id: str) -> str:
+    @staticmethod
+    @lru_cache(maxsize=1024)
+    def get_card_state_file(card_id: str) -> str:
         """Get the state file path for a specific card."""
         return os.path.join(CARDS_STATE_DIR, f"{card_id}.json")
     
+    def read_state_file(self, state_file: str) -> Dict:
+        """Read and normalize a card state file."""
+        with open(state_file, 'rb') as f:
+            state = json_loads(f.read())
+        # Processed IDs are stored as lists on disk but kept as sets in memory;
+        # PR comment IDs are always strings for consistency
+        state['processed_comments'] = set(state.get('processed_comments', []))
+        state['processed_pr_comments'] = {str(id) for id in state.get('processed_pr_comments', [])}
+        return state
+    
+    def load_all_states(self):
+        """Sync the in-memory state cache with the state directory.
+        
+        Only files whose modification time changed since they were last read
+        or written are parsed, so external edits are picked up without
+        re-reading every card.
+        """
+        seen = set()
+        with os.scandir(CARDS_STATE_DIR) as entries:
+            for entry in entries:
+                if not entry.name.endswith('.json'):
+                    continue
+                seen.add(entry.path)
+                try:
+                    mtime = entry.stat().st_mtime_ns
+                    known = self._state_files.get(entry.path)
+                    if known and known[0] == mtime:
+                        continue
+                    state = self.read_state_file(entry.path)
+                    card_id = state.get('card_id', entry.name[:-len('.json')])
+                    self._states[card_id] = state
+                    self._saved_snapshots[card_id] = self.state_snapshot(state)
+                    self._state_files[entry.path] = (mtime, card_id)
+                    if self.debug and known:
+                        print(f"[DEBUG] Reloaded state for card {card_id} after external change")
+                except Exception as e:
+                    print(f"Error loading state file {entry.path}: {e}")
+        
+        # Forget cards whose state file was removed
+        for path in set(self._state_files) - seen:
+            _, card_id = self._state_files.pop(path)
+            self._states.pop(card_id, None)
+            self._saved_snapshots.pop(card_id, None)
+    
+    def serialize_state(self, state: Dict) -> Dict:
+        """Return a JSON-serializable copy of a state, with ID sets as sorted lists."""
+        return {k: sorted(v) if isinstance(v, set) else v for k, v in state.items()}
+    
+    def state_snapshot(self, state: Dict) -> bytes:
+        """Serialize a state for change detection, ignoring the update timestamp."""
+        serialized = self.serialize_state(state)
+        serialized.pop('last_update', None)
+        return json_dumps(serialized, sort_keys=True)
+    
     def load_card_state(self, card_id: str) -> Dict:
-        """Load state for a specific card."""
-        state_file = self.get_card_state_file(card_id)
-        if os.path.exists(state_file):
-            with open(state_file, 'r') as f:
-                state = json.load(f)
-                # Ensure processed_pr_comments exists and contains only strings
-                if 'processed_pr_comments' not in state:
-                    state['processed_pr_comments'] = []
-                else:
-                    # Ensure all IDs are strings for consistency
-                    state['processed_pr_comments'] = [str(id) for id in state['processed_pr_comments']]
-                return state
+        """Load state for a specific card.
+        
+        Returns the cached state, so changes made by the caller are visible to
+        later loads. New cards get a fresh state that is only cached on save.
+        """
+        if card_id in self._states:
+            return self._states[card_id]
         return {
             'card_id': card_id,
             'branch': None,
@@ -116,48 +689,50 @@ class ExtendedWorkflowAutomation:
             'pr_id': None,
             'session_id': None,  # Claude Code session ID for conversation continuity
             'last_update': None,
-            'processed_comments': [],
-            'processed_pr_comments': [],  # List of string IDs of processed PR comments
+            'processed_comments': set(),
+            'processed_pr_comments': set(),  # Set of string IDs of processed PR comments
             'created_at': datetime.now().isoformat()
         }
     
     def save_card_state(self, card_id: str, state: Dict):
-        """Save state for a specific card."""
+        """Save state for a specific card, writing to disk only if it changed."""
+        self._states[card_id] = state
+        
+        # Sort the ID sets once; the snapshot and the file both use this copy
+        serialized = self.serialize_state(state)
+        snapshot = self.state_snapshot(serialized)
+        if self._saved_snapshots.get(card_id) == snapshot:
+            if self.debug:
+                print(f"[DEBUG] State for card {card_id} unchanged, skipping write")
+            return
+        
         state_file = self.get_card_state_file(card_id)
-        state['last_update'] = datetime.now().isoformat()
+        state['last_update'] = serialized['last_update'] = datetime.now().isoformat()
         
         if self.debug:
             print(f"[DEBUG] Saving state for card {card_id}")
             print(f"[DEBUG] Processed Trello comments: {len(state.get('processed_comments', []))} IDs")
             print(f"[DEBUG] Processed PR comments: {len(state.get('processed_pr_comments', []))} IDs")
         
-        with open(state_file, 'w') as f:
-            json.dump(state, f, indent=2)
+        # Write to a temp file and rename so a crash never leaves a partial file
+        with tempfile.NamedTemporaryFile('wb', dir=CARDS_STATE_DIR, suffix='.tmp', delete=False) as f:
+            f.write(json_dumps(serialized, indent=True))
+        os.replace(f.name, state_file)
+        self._saved_snapshots[card_id] = snapshot
+        self._state_files[state_file] = (os.stat(state_file).st_mtime_ns, card_id)
     
     def get_all_card_states(self) -> Dict[str, Dict]:
-        """Load all card states."""
-        states = {}
-        for state_file in Path(CARDS_STATE_DIR).glob("*.json"):
-            try:
-                with open(state_file, 'r') as f:
-                    state = json.load(f)
-                    card_id = state.get('card_id', state_file.stem)
-                    states[card_id] = state
-            except Exception as e:
-                print(f"Error loading state file {state_file}: {e}")
-        return states
+        """Return all cached card states, refreshed from any changed state files."""
+        self.load_all_states()
+        return dict(self._states)
 
 
     # BitBucket API Rate Limiting:
-    # BitBucket Cloud has API rate limits. While this script's 60-second loop delay
-    # (if run with --loop) significantly reduces the risk of hitting these limits for
-    # typical usage, very high activity repositories or more frequent checks might
-    # approach these limits.
-    # The API typically returns a 429 HTTP status code when rate limits are exceeded.
-    # Currently, the script relies on the delay and general error handling.
-    # For more aggressive polling or extremely active repositories, implementing
-    # explicit handling for 429 responses with an exponential backoff and retry
-    # strategy would be a robust future enhancement for the BitBucket API calls.
+    # BitBucket Cloud has API rate limits and answers with a 429 HTTP status
+    # code when they are exceeded. The HTTP sessions retry those responses
+    # (see RateLimitRetry) with exponential backoff, honouring Retry-After, so
+    # a rate-limited page never truncates a comment listing; requests that
+    # still fail raise and are retried on the next check.
     
     # === BitBucket PR Methods ===
     
@@ -171,7 +746,8 @@ class ExtendedWorkflowAutomation:
         url = f"{self.bb_base_url}/pullrequests"
         params = {
             'q': f'source.branch.name="{branch_name}"',
-            'state': 'OPEN'
+            'state': 'OPEN',
+            'fields': PR_LIST_FIELDS
         }
         
         if self.debug:
@@ -180,12 +756,12 @@ class ExtendedWorkflowAutomation:
             print(f"[DEBUG] Query params: {params}")
         
         try:
-            response = requests.get(url, headers=self.bb_headers, params=params)
+            response = self.bb_session.get(url, params=params)
             if self.debug:
                 print(f"[DEBUG] Response status: {response.status_code}")
                 
             if response.status_code == 200:
-                data = response.json()
+                data = json_loads(response.content)
                 if self.debug:
                     print(f"[DEBUG] Found {len(data.get('values', []))} PRs")
                     
@@ -211,14 +787,95 @@ class ExtendedWorkflowAutomation:
         
         return None
     
-    def get_pr_comments(self, pr_id: int) -> List[Dict]:
-        """Fetch all comments from a BitBucket PR and filter for unresolved inline comments."""
+    def get_pr_by_id(self, pr_id: int) -> Optional[Dict]:
+        """Fetch a single PR by ID, or None if it can't be fetched."""
+        if not self.bb_headers:
+            return None
+        try:
+            response = self.bb_session.get(f"{self.bb_base_url}/pullrequests/{pr_id}", params={'fields': PR_FIELDS})
+            if response.status_code == 200:
+                return json_loads(response.content)
+            if self.debug:
+                print(f"[DEBUG] Failed to fetch PR {pr_id}: {response.status_code}")
+        except Exception as e:
+            print(f"Error fetching PR {pr_id}: {e}")
+        return None
+    
+    def find_card_pr(self, card_state: Dict) -> Optional[Dict]:
+        """Return the open PR for a card's branch.
+        
+        A PR ID remembered in the card state is fetched directly, which is
+        cheaper than a search; the branch query is used when there is none
+        or that PR is no longer open.
+        """
+        pr_id = card_state.get('pr_id')
+        if pr_id:
+            pr = self.get_pr_by_id(pr_id)
+            if pr and pr.get('state') == 'OPEN' and pr.get('source', {}).get('branch', {}).get('name') == card_state['branch']:
+                return pr
+        return self.get_pr_by_branch(card_state['branch'])
+    
+    def get_prs_for_branches(self, branch_names: List[str]) -> Dict[str, Optional[Dict]]:
+        """Find the open PRs for several branches with one query per chunk of branches.
+        
+        Returns a mapping of every branch looked up to its PR, or None if it
+        has no open PR. Branches in a chunk whose query failed are left out.
+        """
+        prs_by_branch = {}
+        if not self.bb_headers:
+            return prs_by_branch
+        
+        url = f"{self.bb_base_url}/pullrequests"
+        for i in range(0, len(branch_names), BITBUCKET_BRANCH_QUERY_LIMIT):
+            chunk = branch_names[i:i + BITBUCKET_BRANCH_QUERY_LIMIT]
+            query = ' OR '.join(f'source.branch.name="{name}"' for name in chunk)
+            params = {'q': f'({query})', 'state': 'OPEN', 'pagelen': 50, 'fields': PR_LIST_FIELDS}
+            found = {}
+            try:
+                page_url = url
+                while page_url:
+                    response = self.bb_session.get(page_url, params=params)
+                    params = None
+                    response.raise_for_status()
+                    data = json_loads(response.content)
+                    for pr in data.get('values', []):
+                        found.setdefault(pr['source']['branch']['name'], pr)
+                    page_url = data.get('next')
+            except Exception as e:
+                print(f"Error fetching PRs for {len(chunk)} branches: {e}")
+                continue
+            for name in chunk:
+                prs_by_branch[name] = found.get(name)
+        
+        if self.debug:
+            print(f"[DEBUG] Looked up PRs for {len(prs_by_branch)} branches, "
+                  f"{sum(1 for pr in prs_by_branch.values() if pr)} open")
+        return prs_by_branch
+    
+    def get_pr_comments(self, pr_id: int, known_ids: Optional[set] = None) -> List[Dict]:
+        """Fetch comments from a BitBucket PR, oldest first.
+        
+        Comments are paged newest first. When known_ids is given, paging stops
+        at the first comment whose ID is in it: comment IDs increase over time,
+        so every older comment was already seen when that one was. The known
+        comment is kept in the result so callers still see the boundary.
+        
+        Raises an exception if the comments could not be fetched completely,
+        so callers never mistake a partial listing for the full set.
+        """
         if not self.bb_headers:
             if self.debug:
                 print(f"[DEBUG] Skipping PR comments fetch - no BitBucket headers configured")
             return []
             
         url = f"{self.bb_base_url}/pullrequests/{pr_id}/comments"
+        # Large pages and only the fields process_pr_comments reads; the
+        # 'next' links BitBucket returns already carry these parameters
+        params = {
+            'pagelen': BITBUCKET_PAGELEN,
+            'fields': PR_COMMENT_FIELDS,
+            'sort': '-id'
+        }
         all_comments = []
         
         if self.debug:
@@ -232,26 +889,46 @@ class ExtendedWorkflowAutomation:
                 if self.debug:
                     print(f"[DEBUG] Fetching page {page_count}...")
                     
-                response = requests.get(url, headers=self.bb_headers)
+                response = self.bb_session.get(url, params=params)
+                params = None
                 if self.debug:
                     print(f"[DEBUG] Response status: {response.status_code}")
                     
-                if response.status_code == 200:
-                    data = response.json()
-                    page_comments = data.get('values', [])
-                    all_comments.extend(page_comments)
-                    
-                    if self.debug:
-                        print(f"[DEBUG] Page {page_count}: Found {len(page_comments)} comments")
-                        for idx, comment in enumerate(page_comments):
-                            author = comment.get('user', {}).get('display_name', 'Unknown')
-                            content = comment.get('content', {}).get('raw', '')[:50]
-                            print(f"[DEBUG]   Comment {idx+1}: ID={comment['id']}, Author={author}, Content='{content}...'")
-                    
-                    url = data.get('next')
-                else:
+                if response.status_code != 200:
                     if self.debug:
                         print(f"[DEBUG] Failed to fetch comments. Response: {response.text[:200]}...")
+                    response.raise_for_status()
+                
+                data = json_loads(response.content)
+                page_comments = data.get('values', [])
+                url = data.get('next')
+                
+                if known_ids:
+                    for idx, comment in enumerate(page_comments):
+                        if str(comment['id']) in known_ids:
+                            page_comments = page_comments[:idx + 1]
+                            url = None
+                            if self.debug:
+                                print(f"[DEBUG] Reached already processed comment {comment['id']}, stopping")
+                            break
+                
+                all_comments.extend(page_comments)
+                
+                if self.debug:
+                    print(f"[DEBUG] Page {page_count}: Found {len(page_comments)} comments")
+                    for idx, comment in enumerate(page_comments):
+                        author = comment.get('user', {}).get('display_name', 'Unknown')
+                        content = comment.get('content', {}).get('raw', '')[:50]
+                        print(f"[DEBUG]   Comment {idx+1}: ID={comment['id']}, Author={author}, Content='{content}...'")
+                
+                # Without a stopping point every page is needed, so once the
+                # first page tells us how many there are, fetch the rest at once
+                # (counted with the page size the server actually used)
+                if url and not known_ids and 'size' in data:
+                    pagelen = data.get('pagelen') or BITBUCKET_PAGELEN
+                    page_total = -(-data['size'] // pagelen)
+                    for page_comments in self.get_pr_comment_pages(pr_id, range(2, page_total + 1)):
+                        all_comments.extend(page_comments)
                     break
         except Exception as e:
             print(f"Error fetching PR comments: {e}")
@@ -259,12 +936,39 @@ class ExtendedWorkflowAutomation:
                 import traceback
                 print(f"[DEBUG] Full error traceback:")
                 traceback.print_exc()
+            raise
+        
+        # A comment added while the numbered pages were being fetched shifts
+        # the later pages, so a comment can show up on two of them; keep one
+        all_comments = list({comment['id']: comment for comment in all_comments}.values())
         
         if self.debug:
             print(f"[DEBUG] Total comments fetched: {len(all_comments)}")
-                    
+        
+        all_comments.reverse()
         return all_comments
     
+    def get_pr_comment_pages(self, pr_id: int, pages: range) -> List[List[Dict]]:
+        """Fetch several numbered pages of PR comments concurrently, in page order."""
+        url = f"{self.bb_base_url}/pullrequests/{pr_id}/comments"
+        
+        def fetch_page(page: int) -> List[Dict]:
+            params = {
+                'pagelen': BITBUCKET_PAGELEN,
+                'fields': PR_COMMENT_FIELDS,
+                'sort': '-id',
+                'page': page
+            }
+            response = self.bb_session.get(url, params=params)
+            response.raise_for_status()
+            return json_loads(response.content).get('values', [])
+        
+        if self.debug:
+            print(f"[DEBUG] Fetching pages {pages.start}-{pages.stop - 1} concurrently")
+        
+        with ThreadPoolExecutor(max_workers=MAX_FETCH_WORKERS) as executor:
+            return list(executor.map(fetch_page, pages))
+    
     def add_pr_comment(self, pr_id: int, comment: str):
         """Add a comment to a BitBucket PR."""
         if not self.bb_headers:
@@ -286,13 +990,13 @@ class ExtendedWorkflowAutomation:
             print(f"[DEBUG] Comment preview: {comment[:100]}...")
         
         try:
-            response = requests.post(url, headers=self.bb_headers, json=data)
+            response = self.bb_session.post(url, data=json_dumps(data))
             if self.debug:
                 print(f"[DEBUG] Response status: {response.status_code}")
                 
             if response.status_code == 201:
                 if self.debug:
-                    resp_data = response.json()
+                    resp_data = json_loads(response.content)
                     print(f"[DEBUG] Comment added successfully! Comment ID: {resp_data.get('id', 'N/A')}")
             else:
                 print(f"Failed to add PR comment: {response.status_code}")
@@ -311,71 +1015,129 @@ class ExtendedWorkflowAutomation:
         """Fetch all cards from the specified Trello list."""
         url = f"https://api.trello.com/1/lists/{TRELLO_LIST_ID}/cards"
         params = {
-            'key': TRELLO_API_KEY,
-            'token': TRELLO_TOKEN,
-            'fields': 'id,name,desc,dateLastActivity'
-            # Removed 'actions' and 'actions_limit' - we fetch comments separately
+            'fields': 'id,name,desc,dateLastActivity',
+            'filter': 'open',
+            'attachments': 'true',
+            'attachment_fields': TRELLO_ATTACHMENT_FIELDS
+        }
+        
+        response = self.trello_session.get(url, params=params, timeout=30)
+        response.raise_for_status()
+        cards = json_loads(response.content)
+        self._card_attachments = {card['id']: card.get('attachments', []) for card in cards}
+        self._attachment_contexts = {}
+        return cards
+    
+    def get_trello_card(self, card_id: str) -> Dict:
+        """Fetch a single Trello card."""
+        url = f"https://api.trello.com/1/cards/{card_id}"
+        params = {
+            'fields': 'id,name,desc,dateLastActivity,idList',
+            'attachments': 'true',
+            'attachment_fields': TRELLO_ATTACHMENT_FIELDS
         }
         
-        response = requests.get(url, params=params, timeout=30)
+        response = self.trello_session.get(url, params=params, timeout=30)
         response.raise_for_status()
-        return response.json()
+        card = json_loads(response.content)
+        self._card_attachments[card_id] = card.get('attachments', [])
+        self._attachment_contexts.pop(card_id, None)
+        return card
     
     def get_card_comments(self, card_id: str) -> List[Dict]:
         """Get all comments for a specific card."""
         url = f"https://api.trello.com/1/cards/{card_id}/actions"
         params = {
-            'key': TRELLO_API_KEY,
-            'token': TRELLO_TOKEN,
-            'filter': 'commentCard'
+            'filter': 'commentCard',
+            'fields': TRELLO_COMMENT_FIELDS,
+            'limit': TRELLO_ACTIONS_LIMIT
         }
         
-        response = requests.get(url, params=params, timeout=30)
+        response = self.trello_session.get(url, params=params, timeout=30)
         response.raise_for_status()
-        return response.json()
+        return json_loads(response.content)
+    
+    def get_cards_comments(self, card_ids: List[str]) -> Dict[str, List[Dict]]:
+        """Get comments for several cards using Trello's batch endpoint.
+        
+        Cards whose sub-request fails are left out of the result.
+        """
+        # The sub-request URLs are joined with commas, so the commas in each
+        # one's own query string must be percent-encoded
+        sub_query = urllib.parse.urlencode({
+            'filter': 'commentCard',
+            'fields': TRELLO_COMMENT_FIELDS,
+            'limit': TRELLO_ACTIONS_LIMIT
+        })
+        comments_by_card = {}
+        for i in range(0, len(card_ids), TRELLO_BATCH_LIMIT):
+            chunk = card_ids[i:i + TRELLO_BATCH_LIMIT]
+            params = {
+                'urls': ','.join(f"/cards/{card_id}/actions?{sub_query}" for card_id in chunk)
+            }
+            
+            response = self.trello_session.get("https://api.trello.com/1/batch", params=params, timeout=30)
+            response.raise_for_status()
+            
+            # Results are returned in request order, keyed by status code
+            for card_id, result in zip(chunk, json_loads(response.content)):
+                if '200' in result:
+                    comments_by_card[card_id] = result['200']
+                elif self.debug:
+                    print(f"[DEBUG] Batch comment fetch failed for card {card_id}: {result}")
+        return comments_by_card
     
     def get_card_attachments(self, card_id: str) -> List[Dict]:
         """Get all attachments for a specific card."""
         url = f"https://api.trello.com/1/cards/{card_id}/attachments"
         params = {
-            'key': TRELLO_API_KEY,
-            'token': TRELLO_TOKEN,
-            'fields': 'id,name,url,mimeType,bytes'  # Explicitly request the url field
+            'fields': TRELLO_ATTACHMENT_FIELDS
         }
         
-        response = requests.get(url, params=params)
+        response = self.trello_session.get(url, params=params)
         response.raise_for_status()
-        return response.json()
+        return json_loads(response.content)
     
     def add_comment_to_card(self, card_id: str, comment: str):
         """Add a comment to a Trello card."""
         url = f"https://api.trello.com/1/cards/{card_id}/actions/comments"
-        params = {
-            'key': TRELLO_API_KEY,
-            'token': TRELLO_TOKEN,
+        # The text goes in the form body: comments can be up to 16384
+        # characters, too long for a query string
+        data = {
             'text': comment
         }
         
-        response = requests.post(url, params=params)
+        response = self.trello_session.post(url, data=data)
         response.raise_for_status()
     
     # === Attachment Methods ===
     
-    def download_attachment(self, attachment: Dict, card_id: str) -> str:
-        """Download attachment to workflow state directory and return local path."""
-        # Create card-specific attachments directory
-        attachments_dir = os.path.join(ATTACHMENTS_BASE_DIR, card_id)
-        os.makedirs(attachments_dir, exist_ok=True)
+    def download_attachment(self, attachment: Dict, card_id: str, present: Optional[set] = None) -> str:
+        """Download attachment to workflow state directory and return local path.
         
+        Args:
+            attachment: The Trello attachment object
+            card_id: The Trello card ID
+            present: Names of files already in the card's attachments directory,
+                checked instead of the filesystem if given
+        """
+        attachments_dir = os.path.join(ATTACHMENTS_BASE_DIR, card_id)
         filename = attachment['name']
         local_path = os.path.join(attachments_dir, filename)
         
         # Skip download if file already exists
-        if os.path.exists(local_path):
+        if present is not None:
+            exists = filename in present
+        else:
+            exists = os.path.exists(local_path)
+        if exists:
             if self.debug:
                 print(f"[DEBUG] Attachment already exists: {local_path}")
             return local_path
         
+        # Create card-specific attachments directory
+        os.makedirs(attachments_dir, exist_ok=True)
+        
         try:
             # Debug: print what we're getting
             if self.debug:
@@ -398,12 +1160,17 @@ class ExtendedWorkflowAutomation:
                 print(f"[DEBUG] Download URL: {download_url}")
                 print(f"[DEBUG] Using OAuth Authorization header")
             
-            response = requests.get(download_url, headers=headers)
-            response.raise_for_status()
-            
-            # Save to local file
-            with open(local_path, 'wb') as f:
-                f.write(response.content)
+            # Drop the session's default key/token query parameters for downloads;
+            # the body is streamed to disk instead of being held in memory, via a
+            # temporary name so an interrupted download is not taken for a
+            # complete one next time
+            partial_path = local_path + '.part'
+            with self.trello_session.get(download_url, headers=headers, params={'key': None, 'token': None}, stream=True) as response:
+                response.raise_for_status()
+                with open(partial_path, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                        f.write(chunk)
+            os.replace(partial_path, local_path)
             
             if self.debug:
                 print(f"[DEBUG] Downloaded attachment: {filename} -> {local_path}")
@@ -421,8 +1188,22 @@ class ExtendedWorkflowAutomation:
             return None
     
     def process_attachments(self, card_id: str) -> str:
-        """Process all attachments for a card and return context string."""
-        attachments = self.get_card_attachments(card_id)
+        """Process all attachments for a card and return context string.
+        
+        The context is built once per card fetch, so several instructions
+        for the same card in one run share the downloads and file reads.
+        """
+        context = self._attachment_contexts.get(card_id)
+        if context is None:
+            context = self._attachment_contexts[card_id] = self.build_attachment_context(card_id)
+        return context
+    
+    def build_attachment_context(self, card_id: str) -> str:
+        """Download a card's attachments and describe them for the prompt."""
+        # Use the attachments listed with the card when it was last fetched
+        attachments = self._card_attachments.get(card_id)
+        if attachments is None:
+            attachments = self.get_card_attachments(card_id)
         
         if not attachments:
             return ""
@@ -430,8 +1211,23 @@ class ExtendedWorkflowAutomation:
         attachment_context = "\n\nAttached files available for analysis:"
         attachment_paths = []
         
+        # One directory read answers the already-downloaded check for every attachment
+        try:
+            present = set(os.listdir(os.path.join(ATTACHMENTS_BASE_DIR, card_id)))
+        except FileNotFoundError:
+            present = set()
+        
+        # Downloads are independent, so they run concurrently; attachments
+        # sharing a name would be saved to the same file, so each name is
+        # downloaded once
+        downloads = {}
+        with ThreadPoolExecutor(max_workers=MAX_FETCH_WORKERS) as executor:
+            for attachment in attachments:
+                if attachment['name'] not in downloads:
+                    downloads[attachment['name']] = executor.submit(self.download_attachment, attachment, card_id, present)
+        
         for attachment in attachments:
-            local_path = self.download_attachment(attachment, card_id)
+            local_path = downloads[attachment['name']].result()
             if local_path:
                 attachment_paths.append(local_path)
                 attachment_context += f"\n- {attachment['name']} ({attachment.get('bytes', 'unknown size')} bytes)"
@@ -439,10 +1235,11 @@ class ExtendedWorkflowAutomation:
                 attachment_context += f"\n  Type: {attachment.get('mimeType', 'unknown')}"
                 
                 # For text files, include content directly
-                if attachment.get('mimeType', '').startswith('text/') and attachment.get('bytes', 0) < 10000:
+                if attachment.get('mimeType', '').startswith('text/') and attachment.get('bytes', 0) < ATTACHMENT_INLINE_LIMIT:
                     try:
+                        # Bounded, in case the file is larger than Trello reported
                         with open(local_path, 'r', encoding='utf-8') as f:
-                            content = f.read()
+                            content = f.read(ATTACHMENT_INLINE_LIMIT)
                         attachment_context += f"\n  Content:\n```\n{content}\n```"
                     except Exception as e:
                         attachment_context += f"\n  (Could not read content: {e})"
@@ -462,189 +1259,298 @@ class ExtendedWorkflowAutomation:
     
     # === Git and Claude Code Methods ===
     
-    def create_branch_name(self, card_name: str, session_id: str) -> str:
+    @staticmethod
+    @lru_cache(maxsize=1024)
+    def create_branch_name(card_name: str, session_id: str) -> str:
         """Create a valid git branch name from card title and session ID.
 
         Args:
             card_name: The Trello card name
             session_id: The Claude Code session UUID for guaranteed uniqueness
         """
-        # Clean the card name
-        branch = re.sub(r'[^a-zA-Z0-9\s-]', '', card_name)
-        branch = branch.replace(' ', '-').lower()
-        branch = re.sub(r'-+', '-', branch)
+        branch = slugify_branch(card_name)
         # Use first 8 chars of session ID for uniqueness (short UUID format)
         session_short = session_id[:8]
         return f"feature/{branch}-{session_short}"[:50]
     
-    def create_worktree(self, branch_name: str, card_id: str) -> Tuple[str, str]:
-        """Create a new git worktree for the branch."""
-        worktree_path = os.path.join(WORKTREE_BASE_DIR, f"{card_id}_{branch_name.replace('/', '_')}")
-        
-        # Fetch latest from origin before creating branch
-        print("Fetching latest from origin before any operations...")
-        subprocess.run(
-            ['git', 'fetch', 'origin'],
-            cwd=GIT_REPO_PATH,
-            capture_output=True
-        )
-        
-        # Create branch in the main repo
-        result = subprocess.run(
-            ['git', 'branch', branch_name],
-            cwd=GIT_REPO_PATH,
-            capture_output=True
-        )
-        
-        # Add worktree
-        subprocess.run(
-            ['git', 'worktree', 'add', worktree_path, branch_name],
-            cwd=GIT_REPO_PATH,
-            check=True
-        )
-        
-        # Push branch to remote
-        result = subprocess.run(
-            ['git', 'push', '-u', 'origin', branch_name],
-            cwd=worktree_path,
-            capture_output=True,
-            text=True
-        )
-        
-        return worktree_path, result.stdout + result.stderr
+    @staticmethod
+    @lru_cache(maxsize=1024)
+    def get_worktree_path(branch_name: str, card_id: str) -> str:
+        """Get the worktree path for a card's branch."""
+        return os.path.join(WORKTREE_BASE_DIR, f"{card_id}_{branch_name.replace('/', '_')}")
     
-    def checkout_worktree(self, branch_name: str, card_id: str) -> str:
-        """Checkout existing worktree or create if missing."""
-        worktree_path = os.path.join(WORKTREE_BASE_DIR, f"{card_id}_{branch_name.replace('/', '_')}")
+    def fetch_origin(self):
+        """Fetch from origin, unless update_main_repository already did this run.
         
-        # Fetch latest from origin before any operations
+        Must be called with main_repo_lock held.
+        """
+        if self._origin_fetched:
+            return
         print("Fetching latest from origin before any operations...")
         subprocess.run(
             ['git', 'fetch', 'origin'],
             cwd=GIT_REPO_PATH,
             capture_output=True
         )
+    
+    def create_worktree(self, branch_name: str, card_id: str) -> Tuple[str, str]:
+        """Create a new git worktree for the branch."""
+        worktree_path = self.get_worktree_path(branch_name, card_id)
         
-        if not os.path.exists(worktree_path):
-            # Recreate worktree if it was deleted
+        with self.main_repo_lock:
+            # Fetch latest from origin before creating branch
+            self.fetch_origin()
+            
+            # Create branch in the main repo
+            result = subprocess.run(
+                ['git', 'branch', branch_name],
+                cwd=GIT_REPO_PATH,
+                capture_output=True
+            )
+            
+            # Add worktree
             subprocess.run(
                 ['git', 'worktree', 'add', worktree_path, branch_name],
                 cwd=GIT_REPO_PATH,
                 check=True
             )
+            
+            # Push branch to remote; git prints the PR link on stderr, so
+            # both streams are read as one. Setting the upstream writes the
+            # shared git config, so this stays under the lock too
+            result = subprocess.run(
+                ['git', 'push', '-u', 'origin', branch_name],
+                cwd=worktree_path,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                text=True
+            )
         
-        # Pull latest changes
-        subprocess.run(
-            ['git', 'pull'],
-            cwd=worktree_path,
-            capture_output=True
-        )
+        return worktree_path, result.stdout
+    
+    def checkout_worktree(self, branch_name: str, card_id: str) -> str:
+        """Checkout existing worktree or create if missing.
         
-        return worktree_path
+        Uses the result of a checkout already started by prepare_worktrees
+        for this card, if there is one.
+        """
+        pending = self._pending_checkouts.pop(card_id, None)
+        if pending is not None:
+            return pending.result()
+        return self.update_worktree(branch_name, card_id)
     
-    def execute_claude_code(self, instructions: str, worktree_path: str, session_id: Optional[str] = None, is_first_interaction: bool = True) -> str:
-        """Execute instructions using Claude Code in the specified directory.
-
+    def prepare_worktrees(self, executor: ThreadPoolExecutor, branches: Dict[str, str]):
+        """Start checking out worktrees for several cards in the background.
+        
         Args:
-            instructions: The instruction to execute
-            worktree_path: Path to the git worktree
-            session_id: Optional session ID for conversation continuity
-            is_first_interaction: True for first interaction (creates session), False for continuing
+            executor: Executor to run the checkouts on
+            branches: Mapping of card ID to branch name
         """
-        # Debug logging
-        if self.debug:
-            print(f"\n[DEBUG] Executing Claude Code with instruction length: {len(instructions)} characters")
-            print(f"[DEBUG] First 200 chars of instruction: {instructions[:200]}...")
+        for card_id, branch_name in branches.items():
+            self._pending_checkouts[card_id] = executor.submit(self.update_worktree, branch_name, card_id)
+    
+    def update_worktree(self, branch_name: str, card_id: str) -> str:
+        """Make sure the card's worktree exists and pull its latest changes."""
+        worktree_path = self.get_worktree_path(branch_name, card_id)
+        
+        # The main repository is shared by all worktrees, so operations on it
+        # are serialized; the pull below only touches this card's worktree
+        with self.main_repo_lock:
+            # Fetch latest from origin before any operations
+            self.fetch_origin()
+            
+            if not os.path.exists(worktree_path):
+                # Recreate worktree if it was deleted
+                subprocess.run(
+                    ['git', 'worktree', 'add', worktree_path, branch_name],
+                    cwd=GIT_REPO_PATH,
+                    check=True
+                )
+        
+        # Origin was just fetched, so the upstream ref is current: skip the
+        # pull when the branch already matches it, and fast-forward locally
+        # when it is only behind
+        revs = subprocess.run(
+            ['git', 'rev-parse', 'HEAD', '@{upstream}'],
+            cwd=worktree_path,
+            capture_output=True,
+            text=True
+        )
+        head, _, upstream = revs.stdout.strip().partition('\n')
+        if revs.returncode == 0 and head == upstream:
+            if self.debug:
+                print(f"[DEBUG] Worktree for {branch_name} is up to date")
+            return worktree_path
+        
+        merged = revs.returncode == 0 and subprocess.run(
+            ['git', 'merge', '--ff-only', '@{upstream}'],
+            cwd=worktree_path,
+            capture_output=True
+        ).returncode == 0
+        if not merged:
+            # No upstream or diverged history: let pull handle it as before
+            subprocess.run(
+                ['git', 'pull'],
+                cwd=worktree_path,
+                capture_output=True
+            )
+        
+        return worktree_path
+    
+    def execute_claude_code(self, instructions: str, worktree_path: str, session_id: Optional[str] = None, is_first_interaction: bool = True) -> str:
+        """Execute instructions using Claude Code in the specified directory.
+
+        Args:
+            instructions: The instruction to execute
+            worktree_path: Path to the git worktree
+            session_id: Optional session ID for conversation continuity
+            is_first_interaction: True for first interaction (creates session), False for continuing
+        """
+        # Debug logging
+        if self.debug:
+            print(f"\n[DEBUG] Executing Claude Code with instruction length: {len(instructions)} characters")
+            print(f"[DEBUG] First 200 chars of instruction: {instructions[:200]}...")
             print(f"[DEBUG] Session ID: {session_id if session_id else 'None (new session)'}")
             print(f"[DEBUG] Is first interaction: {is_first_interaction}")
             if len(instructions) > 10000:
                 print(f"[WARNING] Very long instruction detected: {len(instructions)} characters!")
 
-        # Escape quotes in instructions for shell command
-        escaped_instructions = instructions.replace('"', '\\"')
-
-        # Build command with session handling
-        cmd = ['claude', '--dangerously-skip-permissions']
-        if session_id:
-            if is_first_interaction:
-                # First interaction: create new session with specific ID
-                cmd.extend(['--session-id', session_id])
-            else:
-                # Subsequent interactions: resume existing session
-                cmd.extend(['--resume', session_id])
-        cmd.extend(['-p', escaped_instructions])
+        session = self.get_claude_session(worktree_path, session_id, is_first_interaction)
+        self._instructions_run += 1
 
-        result = subprocess.run(
-            cmd,
-            cwd=worktree_path,
-            capture_output=True,
-            text=True,
-            timeout=1800  # 30 minutes timeout
-        )
+        try:
+            result_text, stderr = session.send(instructions, CLAUDE_TIMEOUT)
+        finally:
+            with self._claude_lock:
+                self._claude_in_use.discard(worktree_path)
+                if not session.is_alive():
+                    self._claude_sessions.pop(worktree_path, None)
 
-        output = f"Claude Code Output:\n{result.stdout}"
-        if result.stderr.strip():
-            output += f"\n\nErrors (if any):\n{result.stderr}"
+        output = f"Claude Code Output:\n{result_text}"
+        if stderr.strip():
+            output += f"\n\nErrors (if any):\n{stderr}"
             # Check for specific error
-            if "Prompt is too long" in result.stderr and self.debug:
+            if "Prompt is too long" in stderr and self.debug:
                 print(f"[ERROR] Claude reported 'Prompt is too long' for instruction of {len(instructions)} characters")
         return output
     
+    def get_claude_session(self, worktree_path: str, session_id: Optional[str], is_first_interaction: bool) -> ClaudeSession:
+        """Return the worktree's running Claude Code process, starting one if needed.
+        
+        At most CLAUDE_POOL_SIZE processes are kept; starting another closes
+        the least recently used idle one. The worktree is marked in use until
+        execute_claude_code has its result.
+        """
+        evicted = []
+        with self._claude_lock:
+            if self._claude_interrupted:
+                raise RuntimeError("Claude Code was interrupted")
+            self._claude_in_use.add(worktree_path)
+            session = self._claude_sessions.get(worktree_path)
+            if session is not None and session.is_alive():
+                self._claude_sessions.move_to_end(worktree_path)
+                if self.debug:
+                    print(f"[DEBUG] Reusing running Claude Code process for {worktree_path}")
+                return session
+            
+            self._claude_sessions.pop(worktree_path, None)
+            idle = [path for path in self._claude_sessions if path not in self._claude_in_use]
+            while len(self._claude_sessions) >= CLAUDE_POOL_SIZE and idle:
+                evicted_path = idle.pop(0)
+                evicted.append((evicted_path, self._claude_sessions.pop(evicted_path)))
+            
+            session = ClaudeSession(worktree_path, session_id, is_first_interaction, debug=self.debug)
+            self._claude_sessions[worktree_path] = session
+        
+        for evicted_path, evicted_session in evicted:
+            if self.debug:
+                print(f"[DEBUG] Closing least recently used Claude Code process for {evicted_path}")
+            evicted_session.close()
+        return session
+    
+    def interrupt_claude_sessions(self):
+        """Terminate every running Claude Code process and refuse to start more."""
+        with self._claude_lock:
+            self._claude_interrupted = True
+            sessions = list(self._claude_sessions.values())
+        for session in sessions:
+            session.interrupt()
+    
+    def close_claude_sessions(self):
+        """Stop all running Claude Code processes."""
+        for session in self._claude_sessions.values():
+            session.close()
+        self._claude_sessions.clear()
+    
     def commit_and_push(self, worktree_path: str, message: str, card_id: str) -> Tuple[str, Optional[str]]:
         """Commit all changes and push to remote, extracting PR URL if present."""
-        output = []
         pr_url = None
         
-        # Check if there are changes to commit
-        status_result = subprocess.run(
-            ['git', 'status', '--porcelain'],
-            cwd=worktree_path,
-            capture_output=True,
-            text=True
-        )
-        
-        if not status_result.stdout.strip():
-            output.append("No changes to commit")
-            return '\n'.join(output), None
-        
-        result = subprocess.run(
-            ['git', 'add', '-A'],
-            cwd=worktree_path,
-            capture_output=True,
-            text=True
-        )
-        output.append(f"Git add: {result.stdout}")
-        
+        # Status, add, commit and push run in a single shell process; the
+        # commit message is passed as $1 so it needs no quoting. Like Claude
+        # Code it gets its own session, so Ctrl+C can't cut off a push
         commit_message = f"{message}\n\nTrello Card ID: {card_id}"
         result = subprocess.run(
-            ['git', 'commit', '-m', commit_message],
+            ['sh', '-c', COMMIT_AND_PUSH_SCRIPT, 'sh', commit_message],
             cwd=worktree_path,
             capture_output=True,
-            text=True
-        )
-        output.append(f"Git commit: {result.stdout}")
-        
-        result = subprocess.run(
-            ['git', 'push', '--set-upstream', 'origin'],
-            cwd=worktree_path,
-            capture_output=True,
-            text=True
+            text=True,
+            start_new_session=True
         )
-        push_output = result.stdout + result.stderr
-        output.append(f"Git push: {push_output}")
+        output = result.stdout.strip()
         
-        # Extract PR URL from push output
-        pr_match = re.search(r'https://bitbucket\.org/[^\s]+/pull-requests/new[^\s]*', push_output)
-        if not pr_match:
-            pr_match = re.search(r'remote:\s*(https://bitbucket\.org/[^\s]+/pull-requests/\d+)', push_output)
+        # Extract PR URL (new-PR link or existing PR) from push output
+        pr_match = PR_URL_RE.search(output)
         
         if pr_match:
             pr_url = pr_match.group(0)
         
-        return '\n'.join(output), pr_url
+        return output, pr_url
     
     # === Processing Methods ===
     
+    def comment_skip_reason(self, comment_text: str, deleted: bool = False, skip_mentions: bool = False) -> Optional[str]:
+        """Return why a comment should not be run through Claude Code, or None.
+        
+        Args:
+            comment_text: The raw comment text
+            deleted: True if the comment has been deleted
+            skip_mentions: Also skip comments that mention users (Trello)
+        """
+        if not comment_text or comment_text.isspace():
+            return 'empty'
+        if deleted:
+            return 'deleted comment'
+        if skip_mentions and MENTION_RE.search(comment_text):
+            return 'contains user mentions'
+        # Our own replies carry the bot signature
+        if self.bot_signature in comment_text:
+            return 'bot comment detected'
+        return None
+    
+    def has_new_comments(self, card_state: Dict, bundle: Dict) -> bool:
+        """Return True if a prefetched bundle contains unprocessed comments.
+        
+        Comments that would be skipped anyway, such as our own replies, don't
+        count, so they don't make a card's worktree be prepared for nothing.
+        """
+        processed_ids = card_state.get('processed_comments', set())
+        processed_pr_ids = card_state.get('processed_pr_comments', set())
+        return (
+            any(
+                c['id'] not in processed_ids
+                and not self.comment_skip_reason(c['data'].get('text', ''), skip_mentions=True)
+                for c in bundle['comments']
+            )
+            or any(
+                str(c['id']) not in processed_pr_ids
+                and not self.comment_skip_reason(
+                    c.get('content', {}).get('raw', ''), deleted=c.get('deleted', False)
+                )
+                for c in bundle['pr_comments']
+            )
+        )
+    
     def process_new_card(self, card: Dict):
         """Process a newly discovered card."""
         card_id = card['id']
@@ -692,15 +1598,9 @@ class ExtendedWorkflowAutomation:
         
         # Extract PR URL from initial push if not found in commit push
         if not pr_url and push_output:
-            # Check for Bitbucket PR URL
-            pr_match = re.search(r'https://bitbucket\.org/[^\s]+/pull-requests/new[^\s]*', push_output)
+            pr_match = PR_URL_RE.search(push_output)
             if pr_match:
                 pr_url = pr_match.group(0)
-            else:
-                # Check for GitHub PR URL
-                pr_match = re.search(r'https://github\.com/[^\s]+/pull/new/[^\s]*', push_output)
-                if pr_match:
-                    pr_url = pr_match.group(0)
         
         # Update state with PR info
         if pr_url:
@@ -738,53 +1638,42 @@ Git Operations:
         card_name = card['name']
         branch_name = card_state['branch']
         
-        processed_ids = set(card_state.get('processed_comments', []))
+        processed_ids = card_state['processed_comments']
         new_comments = [c for c in comments if c['id'] not in processed_ids]
         
         if not new_comments:
+            # Remember the activity date we've seen so run() can skip idle cards
+            card_state['trello_last_activity'] = card.get('dateLastActivity')
+            prune_processed_ids(processed_ids)
+            self.save_card_state(card_id, card_state)
             return
         
         print(f"Processing {len(new_comments)} new Trello comments for: {card_name} ({card_id})")
         
         worktree_path = self.checkout_worktree(branch_name, card_id)
         
-        for comment in new_comments:
-            comment_text = comment['data']['text']
-
-            # Skip comments with user mentions/tags
-            has_mentions = bool(re.search(r'@\w+', comment_text))
-            if has_mentions:
-                print(f"Skipping Trello comment (contains user mentions)")
-                card_state['processed_comments'].append(comment['id'])
-                continue
-
-            # Skip bot comments - check for bot signature
-            is_bot_comment = self.bot_signature in comment_text
+        # Replies are collected and posted together once all comments are done
+        responses = []
+        try:
+            for comment in new_comments:
+                comment_text = comment['data']['text']
 
-            if is_bot_comment:
-                print(f"Skipping Trello comment (bot comment detected)")
-                card_state['processed_comments'].append(comment['id'])
-                continue
-            
-            # Process attachments for additional context
-            attachment_context = self.process_attachments(card_id)
-
-            # Continue existing session for comment processing
-            claude_instruction = f"{comment_text}{attachment_context}"
-            claude_output = self.execute_claude_code(
-                claude_instruction,
-                worktree_path,
-                card_state.get('session_id'),
-                is_first_interaction=False
-            )
-            
-            commit_output, _ = self.commit_and_push(
-                worktree_path,
-                f"Update from Trello comment: {comment_text[:50]}...",
-                card_id
-            )
-            
-            response_comment = f"""🤖 Processed Trello comment update:
+                # Skip comments with user mentions/tags and bot comments
+                skip_reason = self.comment_skip_reason(comment_text, skip_mentions=True)
+                if skip_reason:
+                    print(f"Skipping Trello comment ({skip_reason})")
+                    card_state['processed_comments'].add(comment['id'])
+                    continue
+                
+                claude_output, commit_output = self.apply_instruction(
+                    card_id,
+                    card_state,
+                    worktree_path,
+                    comment_text,
+                    f"Update from Trello comment: {comment_text[:50]}..."
+                )
+                
+                response_comment = f"""🤖 Processed Trello comment update:
 
 {claude_output}
 
@@ -796,16 +1685,27 @@ Git Operations:
 Pull Request: {card_state.get('pr_url', 'Create PR manually from BitBucket')}
 
 {self.bot_signature}"""
+                
+                responses.append(response_comment)
+                card_state['processed_comments'].add(comment['id'])
             
-            self.add_comment_to_card(card_id, response_comment)
-            card_state['processed_comments'].append(comment['id'])
-        
-        # Save updated state
-        self.save_card_state(card_id, card_state)
-    
+            # Only once every new comment was handled; after a failure the
+            # card must not look idle, so its comments are fetched again
+            card_state['trello_last_activity'] = card.get('dateLastActivity')
+        finally:
+            for response in pack_comments(responses):
+                self.post_reply(card_id, response)
+            # Save updated state
+            self.save_card_state(card_id, card_state)
     
-    def process_pr_comments(self, card_id: str, card_state: Dict):
-        """Process new comments from BitBucket PR as Claude Code instructions."""
+    def process_pr_comments(self, card_id: str, card_state: Dict, prefetched: Optional[Dict] = None):
+        """Process new comments from BitBucket PR as Claude Code instructions.
+        
+        Args:
+            card_id: The Trello card ID
+            card_state: The card's state dictionary
+            prefetched: Optional bundle from fetch_card_bundle to avoid re-fetching
+        """
         branch_name = card_state['branch']
         
         if self.debug:
@@ -814,7 +1714,10 @@ Pull Request: {card_state.get('pr_url', 'Create PR manually from BitBucket')}
             print(f"[DEBUG] Current PR ID in state: {card_state.get('pr_id', 'Not set')}")
         
         # Find PR for this branch
-        pr_data = self.get_pr_by_branch(branch_name)
+        if prefetched is not None:
+            pr_data = prefetched['pr_data']
+        else:
+            pr_data = self.find_card_pr(card_state)
         if not pr_data:
             if self.debug:
                 print(f"[DEBUG] No PR found for branch {branch_name}, skipping PR comment processing")
@@ -825,19 +1728,27 @@ Pull Request: {card_state.get('pr_url', 'Create PR manually from BitBucket')}
         if self.debug:
             print(f"[DEBUG] Found PR ID: {pr_id}")
         
-        # Update PR ID in state if not set
-        if not card_state.get('pr_id'):
+        # Remember the PR, so find_card_pr can fetch it directly instead of
+        # searching by branch; a replacement PR for the branch replaces it
+        if card_state.get('pr_id') != pr_id:
             card_state['pr_id'] = pr_id
             self.save_card_state(card_id, card_state)
             if self.debug:
                 print(f"[DEBUG] Updated card state with PR ID: {pr_id}")
         
         # Get all PR comments
-        pr_comments = self.get_pr_comments(pr_id)
-        
-        # Filter for new comments
-        # Ensure all processed IDs are strings for consistent comparison
-        processed_pr_ids = set(str(id) for id in card_state.get('processed_pr_comments', []))
+        if prefetched is not None:
+            pr_comments = prefetched['pr_comments']
+        else:
+            try:
+                pr_comments = self.get_pr_comments(pr_id, card_state['processed_pr_comments'])
+            except Exception:
+                # Try again next time rather than act on a partial listing
+                return
+        
+        # Filter for new comments; processed IDs are strings, normalized when
+        # the state was read
+        processed_pr_ids = card_state['processed_pr_comments']
         new_pr_comments = [c for c in pr_comments if str(c['id']) not in processed_pr_ids]
         
         if self.debug:
@@ -850,105 +1761,96 @@ Pull Request: {card_state.get('pr_url', 'Create PR manually from BitBucket')}
         if not new_pr_comments:
             if self.debug:
                 print(f"[DEBUG] No new PR comments to process")
+            prune_processed_ids(processed_pr_ids, key=int)
+            card_state['pr_activity'] = pr_activity(pr_data)
+            self.save_card_state(card_id, card_state)
             return
         
         print(f"Found {len(new_pr_comments)} new BitBucket PR comments for card: {card_id}")
         
-        worktree_path = self.checkout_worktree(branch_name, card_id)
-        
+        # Mark comments that need no work as processed; collect the rest
+        actionable = []
         for comment in new_pr_comments:
-            # Extract metadata first to always have comment_id
             comment_id = str(comment['id'])
+            comment_text = comment.get('content', {}).get('raw', '')
+            author_display_name = comment.get('user', {}).get('display_name', 'Unknown')
             
-            try:
-                # Extract comment details
-                comment_text = comment.get('content', {}).get('raw', '')
-                author_display_name = comment.get('user', {}).get('display_name', 'Unknown')
-                author_username = comment.get('user', {}).get('username', 'unknown')
-                created_on = comment.get('created_on', '')
-                updated_on = comment.get('updated_on', '')
-                parent_id = comment.get('parent', {}).get('id') if comment.get('parent') else None
-                inline_path = comment.get('inline', {}).get('path') if comment.get('inline') else None
-                inline_from = comment.get('inline', {}).get('from') if comment.get('inline') else None
-                inline_to = comment.get('inline', {}).get('to') if comment.get('inline') else None
-                
-                if self.debug:
-                    print(f"\n[DEBUG] Processing comment ID: {comment_id}")
-                    print(f"[DEBUG] Author: {author_display_name}")
-                    print(f"[DEBUG] Comment text length: {len(comment_text)} characters")
-                    print(f"[DEBUG] Comment preview: {comment_text[:100]}...")
-                
-                # Skip if comment is empty
-                if not comment_text.strip():
-                    if 'processed_pr_comments' not in card_state:
-                        card_state['processed_pr_comments'] = []
-                    card_state['processed_pr_comments'].append(str(comment_id))
-                    continue
-
-                # Skip if comment has been deleted
-                is_deleted = comment.get('deleted', False)
-                if is_deleted:
-                    print(f"Skipping comment {comment_id} by {author_display_name} (deleted comment)")
-                    if 'processed_pr_comments' not in card_state:
-                        card_state['processed_pr_comments'] = []
-                    card_state['processed_pr_comments'].append(str(comment_id))
-                    continue
-
-                # Skip if comment is from the bot itself - check for bot signature
-                is_bot_comment = self.bot_signature in comment_text
-                
-                if is_bot_comment:
-                    print(f"Skipping comment {comment_id} by {author_display_name} (bot comment detected)")
-                    if 'processed_pr_comments' not in card_state:
-                        card_state['processed_pr_comments'] = []
-                    card_state['processed_pr_comments'].append(str(comment_id))
-                    continue
-
-                print(f"Processing PR comment ID: {comment_id} from {author_display_name}: {comment_text[:50]}...")
-                
-                # Prepare full comment context
-                comment_context = f"""BitBucket PR Comment Details:
-- Author: {author_display_name} (@{author_username})
-- Created: {created_on}
-- Updated: {updated_on}
-- Comment ID: {comment_id}
-{f'- Parent Comment ID: {parent_id}' if parent_id else ''}
-{f'- Inline comment on file: {inline_path}' if inline_path else ''}
-{f'- Line range: {inline_from} to {inline_to}' if inline_from else ''}
-
-Comment Text:
-{comment_text}
-"""
-                
-                # Process attachments for additional context
-                attachment_context = self.process_attachments(card_id)
-
-                # Execute as Claude Code instruction with full context (continue existing session)
-                claude_instruction = f"Analyse the changes made in this git branch. Use this knowledge to process the following feedback.\n{comment_context}{attachment_context}"
-                claude_output = self.execute_claude_code(
-                    claude_instruction,
-                    worktree_path,
-                    card_state.get('session_id'),
-                    is_first_interaction=False
-                )
-                
-                # Commit and push
-                commit_output, _ = self.commit_and_push(
-                    worktree_path,
-                    f"Update from PR comment by {author_display_name}: {comment_text[:50]}...",
-                    card_id
-                )
-                
-                # Add response to both PR and Trello
-                response_text = f"""🤖 Processed BitBucket PR comment:
-
-**Author**: {author_display_name} (@{author_username})
-**Created**: {created_on}
-**Comment ID**: {comment_id}
-{f'**Reply to**: Comment #{parent_id}' if parent_id else ''}
-{f'**File**: {inline_path} (lines {inline_from}-{inline_to})' if inline_path else ''}
+            if self.debug:
+                print(f"\n[DEBUG] Checking comment ID: {comment_id}")
+                print(f"[DEBUG] Author: {author_display_name}")
+                print(f"[DEBUG] Comment text length: {len(comment_text)} characters")
+                print(f"[DEBUG] Comment preview: {comment_text[:100]}...")
+            
+            # Skip empty, deleted and bot comments
+            skip_reason = self.comment_skip_reason(comment_text, deleted=comment.get('deleted', False))
+            if skip_reason:
+                if skip_reason != 'empty':
+                    print(f"Skipping comment {comment_id} by {author_display_name} ({skip_reason})")
+                processed_pr_ids.add(comment_id)
+                continue
+            
+            actionable.append(comment)
+        
+        if actionable:
+            worktree_path = self.checkout_worktree(branch_name, card_id)
+            
+            # Comment storms are handled in one Claude run, commit and reply
+            if len(actionable) >= PR_COMMENT_BATCH_THRESHOLD:
+                groups = [actionable]
+            else:
+                groups = [[comment] for comment in actionable]
+            
+            for group in groups:
+                try:
+                    self.respond_to_pr_comments(card_id, card_state, pr_id, worktree_path, group)
+                except Exception as e:
+                    print(f"Error processing comments {', '.join(str(c['id']) for c in group)}: {e}")
+                    import traceback
+                    traceback.print_exc()
+                finally:
+                    # Always mark as processed (ensure it's a string)
+                    processed_pr_ids.update(str(comment['id']) for comment in group)
+        
+        # Save updated state
+        card_state['pr_activity'] = pr_activity(pr_data)
+        if self.debug:
+            print(f"[DEBUG] Saving card state with {len(card_state.get('processed_pr_comments', []))} processed PR comments")
+            print(f"[DEBUG] Processed PR comment IDs being saved: {sorted(card_state.get('processed_pr_comments', set()))}")
+        self.save_card_state(card_id, card_state)
+    
+    def respond_to_pr_comments(self, card_id: str, card_state: Dict, pr_id: int, worktree_path: str, comments: List[Dict]):
+        """Run Claude Code on one or more PR comments, then commit and reply once."""
+        details = [pr_comment_details(comment) for comment in comments]
+        
+        for d in details:
+            print(f"Processing PR comment ID: {d['comment_id']} from {d['author_display_name']}: {d['comment_text'][:50]}...")
+        
+        comment_context = '\n'.join(pr_comment_context(d) for d in details)
+        
+        if len(details) == 1:
+            commit_message = f"Update from PR comment by {details[0]['author_display_name']}: {details[0]['comment_text'][:50]}..."
+        else:
+            authors = ', '.join(sorted(set(d['author_display_name'] for d in details)))
+            commit_message = f"Update from {len(details)} PR comments by {authors}"
+        
+        # Execute as Claude Code instruction with full context
+        claude_output, commit_output = self.apply_instruction(
+            card_id,
+            card_state,
+            worktree_path,
+            f"Analyse the changes made in this git branch. Use this knowledge to process the following feedback.\n{comment_context}",
+            commit_message
+        )
+        
+        # Add response to both PR and Trello
+        if len(details) == 1:
+            header = "🤖 Processed BitBucket PR comment:"
+        else:
+            header = f"🤖 Processed {len(details)} BitBucket PR comments:"
+        summaries = '\n\n'.join(pr_comment_summary(d) for d in details)
+        response_text = f"""{header}
 
-**Comment**: {comment_text[:200]}{'...' if len(comment_text) > 200 else ''}
+{summaries}
 
 **Claude Code Response**:
 {claude_output}
@@ -959,57 +1861,164 @@ Comment Text:
 ```
 
 {self.bot_signature}"""
-                
-                # Add to PR
-                self.add_pr_comment(pr_id, response_text)
-                
-                # Add to Trello
-                self.add_comment_to_card(card_id, response_text)
-                
+        
+        # Add to PR and Trello
+        self.post_reply(card_id, response_text, pr_id)
+    
+    def apply_instruction(self, card_id: str, card_state: Dict, worktree_path: str, instruction: str, commit_message: str) -> Tuple[str, str]:
+        """Run an instruction through the card's Claude Code session, then commit and push.
+        
+        Attachments on the card are appended to the instruction as context.
+        Returns the Claude Code output and the git output.
+        """
+        attachment_context = self.process_attachments(card_id)
+        
+        # Continue the card's existing session
+        claude_output = self.execute_claude_code(
+            f"{instruction}{attachment_context}",
+            worktree_path,
+            card_state.get('session_id'),
+            is_first_interaction=False
+        )
+        
+        commit_output, _ = self.commit_and_push(worktree_path, commit_message, card_id)
+        return claude_output, commit_output
+    
+    def post_reply(self, card_id: str, text: str, pr_id: Optional[int] = None):
+        """Queue a reply for the Trello card and, if given, the PR.
+        
+        Replies are posted in order on a background thread; wait_for_replies
+        blocks until they have all been sent.
+        """
+        def post(send, *args):
+            try:
+                send(*args)
             except Exception as e:
-                print(f"Error processing comment {comment_id}: {e}")
+                print(f"Error posting reply for card {card_id}: {e}")
                 import traceback
                 traceback.print_exc()
-            finally:
-                # Always mark as processed (ensure it's a string)
-                if 'processed_pr_comments' not in card_state:
-                    card_state['processed_pr_comments'] = []
-                if str(comment_id) not in card_state['processed_pr_comments']:
-                    card_state['processed_pr_comments'].append(str(comment_id))
         
-        # Save updated state
-        if self.debug:
-            print(f"[DEBUG] Saving card state with {len(card_state.get('processed_pr_comments', []))} processed PR comments")
-            print(f"[DEBUG] Processed PR comment IDs being saved: {sorted([str(id) for id in card_state.get('processed_pr_comments', [])])}")
-        self.save_card_state(card_id, card_state)
+        # BitBucket and Trello are posted to concurrently, each in order
+        if pr_id is not None:
+            self._pending_replies.append(self._pr_reply_executor.submit(post, self.add_pr_comment, pr_id, text))
+        self._pending_replies.append(self._reply_executor.submit(post, self.add_comment_to_card, card_id, text))
     
-    def run(self):
-        """Main workflow loop - check for new cards and comments from both Trello and BitBucket."""
-        print(f"Starting workflow check at {datetime.now()}")
-        print(f"Git repo: {GIT_REPO_PATH}")
-        print(f"State directory: {WORKFLOW_STATE_DIR}")
+    def wait_for_replies(self):
+        """Wait until all queued replies have been posted."""
+        for future in self._pending_replies:
+            future.result()
+        self._pending_replies.clear()
+    
+    def fetch_card_bundle(self, card_id: str, card_state: Dict, comments: Optional[List[Dict]] = None,
+                          prs_by_branch: Optional[Dict[str, Optional[Dict]]] = None) -> Dict:
+        """Fetch Trello comments and BitBucket PR data for an existing card.
+        
+        Args:
+            card_id: The Trello card ID
+            card_state: The card's state dictionary
+            comments: Already-fetched Trello comments, fetched here if None
+            prs_by_branch: Result of get_prs_for_branches; the PR is looked up
+                here if the card's branch is missing from it
+        """
+        if comments is None:
+            comments = self.get_card_comments(card_id)
+        bundle = {
+            'comments': comments,
+            'pr_data': None,
+            'pr_comments': []
+        }
+        if BITBUCKET_ACCESS_TOKEN:
+            if prs_by_branch and card_state['branch'] in prs_by_branch:
+                pr_data = prs_by_branch[card_state['branch']]
+            else:
+                pr_data = self.find_card_pr(card_state)
+            bundle['pr_data'] = pr_data
+            # Only page through the comments if the PR changed since last time
+            if pr_data and pr_activity(pr_data) != card_state.get('pr_activity'):
+                bundle['pr_comments'] = self.get_pr_comments(
+                    pr_data['id'],
+                    card_state.get('processed_pr_comments')
+                )
+            elif pr_data and self.debug:
+                print(f"[DEBUG] PR {pr_data['id']} unchanged, skipping comment fetch")
+        return bundle
+    
+    def prefetch_card_data(self, cards: List[Dict], all_card_states: Dict[str, Dict]) -> Dict[str, Dict]:
+        """Fetch comment data for all existing cards concurrently.
+        
+        Only the read-only HTTP phase runs in parallel; Claude Code and git
+        operations are still executed serially afterwards.
+        """
+        pending = [
+            card for card in cards
+            if card['id'] in all_card_states and all_card_states[card['id']].get('branch')
+        ]
+        if not pending:
+            return {}
+        
+        if self.debug:
+            print(f"[DEBUG] Prefetching comment data for {len(pending)} cards")
+        
+        # Cards with no Trello activity since they were last processed have
+        # no new comments; only the others have their comments fetched
+        comments_by_card = {}
+        for card in pending:
+            if trello_unchanged(card, all_card_states[card['id']]):
+                comments_by_card[card['id']] = []
+        missing = [card['id'] for card in pending if card['id'] not in comments_by_card]
+        if missing:
+            try:
+                comments_by_card.update(self.get_cards_comments(missing))
+            except Exception as e:
+                print(f"Error batch fetching card comments: {e}")
+        
+        # Look up the PRs of all cards in a few combined queries
+        prs_by_branch = {}
+        if BITBUCKET_ACCESS_TOKEN:
+            prs_by_branch = self.get_prs_for_branches(
+                sorted({all_card_states[card['id']]['branch'] for card in pending})
+            )
         
-        # Ensure the main repo has the latest changes before processing tickets
+        bundles = {}
+        with ThreadPoolExecutor(max_workers=MAX_FETCH_WORKERS) as executor:
+            futures = {
+                card['id']: executor.submit(
+                    self.fetch_card_bundle,
+                    card['id'],
+                    all_card_states[card['id']],
+                    comments_by_card.get(card['id']),
+                    prs_by_branch
+                )
+                for card in pending
+            }
+            for card_id, future in futures.items():
+                try:
+                    bundles[card_id] = future.result()
+                except Exception as e:
+                    print(f"Error fetching data for card {card_id}: {e}")
+        return bundles
+    
+    def update_main_repository(self):
+        """Ensure the main repo has the latest changes before processing tickets."""
         print("Updating main repository with latest changes...")
+        self._origin_fetched = False
         try:
-            # First fetch all changes from origin
+            # Fetch all remotes once; worktree operations later in this run
+            # reuse the result instead of fetching again
             fetch_result = subprocess.run(
-                ['git', 'fetch', 'origin'],
+                ['git', 'fetch', '--all'],
                 cwd=GIT_REPO_PATH,
                 capture_output=True,
                 text=True
             )
             if fetch_result.returncode != 0:
                 print(f"Warning: Git fetch failed: {fetch_result.stderr}")
+            else:
+                self._origin_fetched = True
+                print("Successfully fetched all remote branches")
             
             # Get current branch
-            current_branch_result = subprocess.run(
-                ['git', 'branch', '--show-current'],
-                cwd=GIT_REPO_PATH,
-                capture_output=True,
-                text=True
-            )
-            current_branch = current_branch_result.stdout.strip()
+            current_branch = get_current_branch()
             
             # Pull latest changes for current branch
             if current_branch:
@@ -1023,20 +2032,67 @@ Comment Text:
                     print(f"Warning: Git pull failed: {pull_result.stderr}")
                 else:
                     print(f"Successfully updated branch '{current_branch}'")
-            
-            # Also fetch all remote branches to ensure we have latest branch information
-            fetch_all_result = subprocess.run(
-                ['git', 'fetch', '--all'],
-                cwd=GIT_REPO_PATH,
-                capture_output=True,
-                text=True
-            )
-            if fetch_all_result.returncode == 0:
-                print("Successfully fetched all remote branches")
                 
         except Exception as e:
             print(f"Warning: Could not update repository: {e}")
             # Continue processing even if update fails
+    
+    def process_card(self, card: Dict, is_known: bool, bundle: Optional[Dict] = None):
+        """Process a single card: either start it or handle its new comments.
+        
+        Args:
+            card: The Trello card
+            is_known: True if a state file already exists for the card
+            bundle: Optional prefetched data from fetch_card_bundle
+        """
+        card_id = card['id']
+        
+        if not is_known:
+            # New card found - skip if description is empty
+            description = card.get('desc', '').strip()
+            if not description:
+                print(f"Skipping card '{card['name']}' ({card_id}) - description is empty")
+                return
+            self.process_new_card(card)
+            return
+        
+        # Existing card - check for new comments from both sources
+        card_state = self.load_card_state(card_id)
+        
+        # Skip if no branch created yet
+        if not card_state.get('branch'):
+            return
+        
+        if bundle is None:
+            # Without Trello activity there are no new comments to fetch
+            comments = [] if trello_unchanged(card, card_state) else None
+            bundle = self.fetch_card_bundle(card_id, card_state, comments)
+        
+        # Process Trello comments
+        self.process_card_comments(card, bundle['comments'], card_state)
+        
+        # Process BitBucket PR comments (if PR exists)
+        if BITBUCKET_ACCESS_TOKEN:  # Only if BitBucket is configured
+            if self.debug:
+                print(f"\n[DEBUG] Checking for BitBucket PR comments for card: {card_id}")
+            self.process_pr_comments(card_id, card_state, bundle)
+        elif self.debug:
+            print(f"\n[DEBUG] Skipping BitBucket PR comment check - no access token configured")
+    
+    def run(self) -> bool:
+        """Main workflow loop - check for new cards and comments from both Trello and BitBucket.
+        
+        Returns True if any card or comment was handed to Claude Code.
+        """
+        instructions_before = self._instructions_run
+        print(f"Starting workflow check at {datetime.now()}")
+        print(f"Git repo: {GIT_REPO_PATH}")
+        print(f"State directory: {WORKFLOW_STATE_DIR}")
+        
+        # The git fetch and pull overlap with the Trello and BitBucket
+        # requests below; no worktree is touched until they have finished
+        update_thread = threading.Thread(target=self.update_main_repository, daemon=True)
+        update_thread.start()
         
         try:
             # Load all existing card states
@@ -1046,35 +2102,53 @@ Comment Text:
             cards = self.get_trello_cards()
             print(f"Found {len(cards)} cards in Trello list")
             
-            for card in cards:
-                card_id = card['id']
-
-                if card_id not in all_card_states:
-                    # New card found - skip if description is empty
-                    description = card.get('desc', '').strip()
-                    if not description:
-                        print(f"Skipping card '{card['name']}' ({card_id}) - description is empty")
-                        continue
-                    self.process_new_card(card)
-                else:
-                    # Existing card - check for new comments from both sources
-                    card_state = self.load_card_state(card_id)  # Load fresh state
-                    
-                    # Skip if no branch created yet
-                    if not card_state.get('branch'):
-                        continue
-                    
-                    # Process Trello comments
-                    comments = self.get_card_comments(card_id)
-                    self.process_card_comments(card, comments, card_state)
-                    
-                    # Process BitBucket PR comments (if PR exists)
-                    if BITBUCKET_ACCESS_TOKEN:  # Only if BitBucket is configured
-                        if self.debug:
-                            print(f"\n[DEBUG] Checking for BitBucket PR comments for card: {card_id}")
-                        self.process_pr_comments(card_id, card_state)
-                    elif self.debug:
-                        print(f"\n[DEBUG] Skipping BitBucket PR comment check - no access token configured")
+            # Fetch comments for all existing cards up front, in parallel
+            bundles = self.prefetch_card_data(cards, all_card_states)
+            
+            update_thread.join()
+            with ThreadPoolExecutor(max_workers=MAX_GIT_WORKERS) as git_executor:
+                # Start updating the worktrees of cards with new comments so
+                # their git network I/O overlaps with processing other cards
+                self.prepare_worktrees(git_executor, {
+                    card_id: all_card_states[card_id]['branch']
+                    for card_id, bundle in bundles.items()
+                    if self.has_new_comments(all_card_states[card_id], bundle)
+                })
+                
+                try:
+                    # Cards work in separate worktrees, so up to
+                    # MAX_CARD_WORKERS of them are processed at once
+                    with ThreadPoolExecutor(max_workers=MAX_CARD_WORKERS) as card_executor:
+                        futures = {}
+                        for card in cards:
+                            card_id = card['id']
+                            is_known = card_id in all_card_states
+                            
+                            # Skip if fetching this card's data failed
+                            if is_known and all_card_states[card_id].get('branch') and card_id not in bundles:
+                                continue
+                            
+                            futures[card_id] = card_executor.submit(self.process_card, card, is_known, bundles.get(card_id))
+                        
+                        try:
+                            for card_id, future in futures.items():
+                                try:
+                                    future.result()
+                                except Exception as e:
+                                    print(f"Error processing card {card_id}: {e}")
+                                    import traceback
+                                    traceback.print_exc()
+                        except KeyboardInterrupt:
+                            # Leaving the executor waits for the running
+                            # cards, and Claude Code doesn't see the Ctrl+C,
+                            # so stop it and drop the cards not started yet
+                            print("\nInterrupting Claude Code...")
+                            self.interrupt_claude_sessions()
+                            card_executor.shutdown(wait=False, cancel_futures=True)
+                            raise
+                finally:
+                    self._pending_checkouts.clear()
+                    self.wait_for_replies()
             
             print("Workflow check completed successfully")
             
@@ -1082,80 +2156,462 @@ Comment Text:
             print(f"Error in workflow: {e}")
             import traceback
             traceback.print_exc()
+        finally:
+            update_thread.join()
+        
+        return self._instructions_run > instructions_before
+    
+    def run_card(self, card_id: str):
+        """Process a single card, e.g. in response to a webhook event."""
+        print(f"Starting workflow check for card {card_id} at {datetime.now()}")
+        
+        try:
+            card = self.get_trello_card(card_id)
+            if card.get('idList') != TRELLO_LIST_ID:
+                if self.debug:
+                    print(f"[DEBUG] Card {card_id} is not in the monitored list, skipping")
+                return
+            
+            self.update_main_repository()
+            is_known = card_id in self.get_all_card_states()
+            self.process_card(card, is_known)
+            
+        except Exception as e:
+            print(f"Error processing card {card_id}: {e}")
+            import traceback
+            traceback.print_exc()
+        finally:
+            self.wait_for_replies()
+    
+    # === Webhook Methods ===
+    
+    def find_card_by_branch(self, branch_name: str) -> Optional[str]:
+        """Return the ID of the card that owns the given branch, if any.
+        
+        Runs on the webhook receiver threads, so it reads the in-memory cache
+        rather than rescanning the state directory; the worker's run_card
+        refreshes the cache before processing.
+        """
+        for card_id, state in list(self._states.items()):
+            if state.get('branch') == branch_name:
+                return card_id
+        return None
+    
+    def register_webhooks(self, callback_url: str):
+        """Register Trello and BitBucket webhooks pointing at this receiver."""
+        callback_url = callback_url.rstrip('/')
+        
+        # Trello webhook on the monitored list (covers comments on its cards)
+        try:
+            response = self.trello_session.post(
+                "https://api.trello.com/1/webhooks/",
+                params={
+                    'idModel': TRELLO_LIST_ID,
+                    'callbackURL': f"{callback_url}/trello",
+                    'description': 'auto-claude-with-trello'
+                },
+                timeout=30
+            )
+            if response.status_code == 200:
+                print("Registered Trello webhook")
+            else:
+                # Trello returns 400 if an identical webhook already exists
+                print(f"Trello webhook not registered: {response.status_code} {response.text[:200]}")
+        except Exception as e:
+            print(f"Error registering Trello webhook: {e}")
+        
+        if not self.bb_headers:
+            return
+        
+        # BitBucket webhook for new PR comments
+        data = {
+            'description': 'auto-claude-with-trello',
+            'url': f"{callback_url}/bitbucket",
+            'active': True,
+            'events': ['pullrequest:comment_created']
+        }
+        if BITBUCKET_WEBHOOK_SECRET:
+            data['secret'] = BITBUCKET_WEBHOOK_SECRET
+        try:
+            # BitBucket does not reject duplicate hooks, so look for ours first
+            # rather than adding another one on every restart
+            page_url = f"{self.bb_base_url}/hooks"
+            while page_url:
+                response = self.bb_session.get(page_url)
+                response.raise_for_status()
+                page = json_loads(response.content)
+                if any(hook.get('url') == data['url'] for hook in page.get('values', [])):
+                    print("BitBucket webhook already registered")
+                    return
+                page_url = page.get('next')
+            
+            response = self.bb_session.post(f"{self.bb_base_url}/hooks", data=json_dumps(data))
+            if response.status_code == 201:
+                print("Registered BitBucket webhook")
+            else:
+                print(f"BitBucket webhook not registered: {response.status_code} {response.text[:200]}")
+        except Exception as e:
+            print(f"Error registering BitBucket webhook: {e}")
+
+
+def get_current_branch() -> str:
+    """Return the branch checked out in the main repository, or '' if detached.
+    
+    Reads .git/HEAD directly rather than starting a git process; falls back
+    to git branch --show-current when .git is not a plain directory.
+    """
+    try:
+        with open(os.path.join(GIT_REPO_PATH, '.git', 'HEAD')) as f:
+            head = f.read().strip()
+    except (NotADirectoryError, FileNotFoundError):
+        result = subprocess.run(
+            ['git', 'branch', '--show-current'],
+            cwd=GIT_REPO_PATH,
+            capture_output=True,
+            text=True
+        )
+        return result.stdout.strip()
+    prefix = 'ref: refs/heads/'
+    return head[len(prefix):] if head.startswith(prefix) else ''
 
 
-def cleanup_worktrees():
-    """Clean up any orphaned worktrees."""
+def list_worktrees() -> List[str]:
+    """Return the paths of all worktrees of the repository.
+    
+    Reads the worktree admin entries under .git/worktrees directly, the way
+    git itself does, instead of starting a git process; falls back to
+    git worktree list when .git is not a plain directory.
+    """
+    git_dir = os.path.join(GIT_REPO_PATH, '.git')
+    if not os.path.isdir(git_dir):
+        result = subprocess.run(
+            ['git', 'worktree', 'list', '--porcelain'],
+            cwd=GIT_REPO_PATH,
+            capture_output=True,
+            text=True
+        )
+        prefix = 'worktree '
+        return [line[len(prefix):] for line in result.stdout.splitlines() if line.startswith(prefix)]
+    
+    worktree_paths = [GIT_REPO_PATH]
+    try:
+        entries = os.scandir(os.path.join(git_dir, 'worktrees'))
+    except FileNotFoundError:
+        return worktree_paths
+    with entries:
+        for entry in entries:
+            try:
+                with open(os.path.join(entry.path, 'gitdir')) as f:
+                    gitdir = f.read().strip()
+            except OSError:
+                continue
+            # gitdir points at the worktree's .git file and may be relative
+            # to the admin entry
+            worktree_paths.append(os.path.dirname(os.path.normpath(os.path.join(entry.path, gitdir))))
+    return worktree_paths
+
+
+def cleanup_worktrees(force: bool = False):
+    """Clean up any orphaned worktrees.
+    
+    Args:
+        force: Scan even if no worktree changed since the last cleanup
+    """
+    if not force and _worktrees_unchanged_since_cleanup():
+        return
     print("Cleaning up worktrees...")
     
-    # List all worktrees
+    if not _remove_listed_orphans(list_worktrees()):
+        return
+    try:
+        with open(CLEANUP_STAMP_FILE, 'a'):
+            pass
+        os.utime(CLEANUP_STAMP_FILE)
+    except OSError:
+        pass
+
+
+def _worktrees_unchanged_since_cleanup() -> bool:
+    """Check whether no worktree was added or removed since the last cleanup."""
+    watched = [os.path.join(GIT_REPO_PATH, '.git', 'worktrees'), WORKTREE_BASE_DIR]
+    try:
+        stamp = os.stat(CLEANUP_STAMP_FILE).st_mtime_ns
+        return all(os.stat(path).st_mtime_ns < stamp for path in watched)
+    except OSError:
+        return False
+
+
+def _remove_listed_orphans(worktree_paths: List[str]) -> bool:
+    """Remove the worktrees among worktree_paths whose directory is missing.
+    
+    Returns False if any of them could not be removed.
+    """
+    # Our worktrees all live in WORKTREE_BASE_DIR, so one directory read
+    # answers the existence check for them; others are checked individually
+    try:
+        present = {entry.name for entry in os.scandir(WORKTREE_BASE_DIR) if entry.is_dir()}
+    except FileNotFoundError:
+        present = set()
+    
+    def exists(path: str) -> bool:
+        if os.path.dirname(path) == WORKTREE_BASE_DIR:
+            return os.path.basename(path) in present
+        return os.path.exists(path)
+    
+    orphaned = [path for path in worktree_paths if path != GIT_REPO_PATH and not exists(path)]
+    if not orphaned:
+        return True
+    
+    print('\n'.join(f"Removing orphaned worktree: {path}" for path in orphaned))
+    
+    # A single prune drops the admin entries of every missing worktree
     result = subprocess.run(
-        ['git', 'worktree', 'list', '--porcelain'],
+        ['git', 'worktree', 'prune', '--expire=now'],
         cwd=GIT_REPO_PATH,
-        capture_output=True,
-        text=True
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
     )
-    
-    # Parse worktree paths
-    worktree_paths = []
-    for line in result.stdout.split('\n'):
-        if line.startswith('worktree '):
-            worktree_paths.append(line.split(' ', 1)[1])
-    
-    # Remove worktrees that don't exist
-    for path in worktree_paths:
-        if not os.path.exists(path) and path != GIT_REPO_PATH:
-            print(f"Removing orphaned worktree: {path}")
-            subprocess.run(
-                ['git', 'worktree', 'remove', path],
-                cwd=GIT_REPO_PATH,
-                capture_output=True
-            )
+    if result.returncode != 0:
+        # Remove them individually instead, up to MAX_GIT_WORKERS at a time,
+        # from a single xargs process; NUL-separated paths need no quoting
+        result = subprocess.run(
+            ['xargs', '-0', '-n', '1', '-P', str(MAX_GIT_WORKERS), 'git', 'worktree', 'remove', '--force'],
+            input='\0'.join(orphaned),
+            cwd=GIT_REPO_PATH,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            text=True
+        )
+    return result.returncode == 0
 
 
 def cleanup_old_attachments(days_old=7):
     """Clean up attachment files older than specified days."""
-    if not os.path.exists(ATTACHMENTS_BASE_DIR):
+    cutoff_time = time.time() - (days_old * 24 * 60 * 60)
+    
+    # scandir gives each entry's type without a stat, and its mtime with one
+    try:
+        with os.scandir(ATTACHMENTS_BASE_DIR) as entries:
+            old_dirs = [
+                entry for entry in entries
+                if entry.is_dir(follow_symlinks=False) and entry.stat(follow_symlinks=False).st_mtime < cutoff_time
+            ]
+    except FileNotFoundError:
         return
     
-    import time
-    cutoff_time = time.time() - (days_old * 24 * 60 * 60)
+    for entry in old_dirs:
+        try:
+            shutil.rmtree(entry.path)
+            print(f"Cleaned up old attachments for card: {entry.name}")
+        except Exception as e:
+            print(f"Error cleaning up old attachments for {entry.name}: {e}")
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    """Receive Trello and BitBucket webhooks and queue the affected card."""
     
-    for card_dir in os.listdir(ATTACHMENTS_BASE_DIR):
-        card_path = os.path.join(ATTACHMENTS_BASE_DIR, card_dir)
-        if os.path.isdir(card_path):
-            # Check if directory is old
-            if os.path.getmtime(card_path) < cutoff_time:
-                try:
-                    shutil.rmtree(card_path)
-                    print(f"Cleaned up old attachments for card: {card_dir}")
-                except Exception as e:
-                    print(f"Error cleaning up old attachments for {card_dir}: {e}")
+    # Trello actions that may require work on a card
+    TRELLO_ACTIONS = {'commentCard', 'createCard', 'updateCard'}
+    
+    # Set by run_webhook_server
+    automation = None
+    enqueue = None
+    
+    def do_HEAD(self):
+        # Trello sends a HEAD request to verify the callback URL on registration
+        self.send_response(200)
+        self.end_headers()
+    
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        
+        if self.path.rstrip('/') == '/trello':
+            if not self.verify_trello_signature(body):
+                self.send_response(401)
+                self.end_headers()
+                return
+            card_id = self.parse_trello_event(body)
+        elif self.path.rstrip('/') == '/bitbucket':
+            if not self.verify_bitbucket_signature(body):
+                self.send_response(401)
+                self.end_headers()
+                return
+            card_id = self.parse_bitbucket_event(body)
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+        
+        # Acknowledge immediately; the work happens on the worker thread
+        self.send_response(200)
+        self.end_headers()
+        
+        if card_id:
+            self.enqueue(card_id)
+    
+    def verify_trello_signature(self, body: bytes) -> bool:
+        """Verify the X-Trello-Webhook signature (HMAC-SHA1 of body + callback URL)."""
+        if not TRELLO_WEBHOOK_SECRET or not WEBHOOK_CALLBACK_URL:
+            return True
+        callback_url = f"{WEBHOOK_CALLBACK_URL.rstrip('/')}/trello"
+        digest = hmac.new(
+            TRELLO_WEBHOOK_SECRET.encode(),
+            body + callback_url.encode(),
+            hashlib.sha1
+        ).digest()
+        expected = base64.b64encode(digest).decode()
+        return hmac.compare_digest(expected, self.headers.get('X-Trello-Webhook', ''))
+    
+    def verify_bitbucket_signature(self, body: bytes) -> bool:
+        """Verify the X-Hub-Signature header (HMAC-SHA256 of the raw body)."""
+        if not BITBUCKET_WEBHOOK_SECRET:
+            return True
+        expected = 'sha256=' + hmac.new(BITBUCKET_WEBHOOK_SECRET.encode(), body, hashlib.sha256).hexdigest()
+        return hmac.compare_digest(expected, self.headers.get('X-Hub-Signature', ''))
+    
+    def parse_trello_event(self, body: bytes) -> Optional[str]:
+        """Extract the card ID from a Trello webhook payload."""
+        try:
+            action = json_loads(body).get('action', {})
+        except ValueError:
+            return None
+        if action.get('type') not in self.TRELLO_ACTIONS:
+            return None
+        return action.get('data', {}).get('card', {}).get('id')
+    
+    def parse_bitbucket_event(self, body: bytes) -> Optional[str]:
+        """Map a BitBucket PR comment payload to the card owning the PR's branch."""
+        try:
+            payload = json_loads(body)
+        except ValueError:
+            return None
+        branch_name = payload.get('pullrequest', {}).get('source', {}).get('branch', {}).get('name')
+        if not branch_name:
+            return None
+        return self.automation.find_card_by_branch(branch_name)
+    
+    def log_message(self, format, *args):
+        if self.automation.debug:
+            super().log_message(format, *args)
+
+
+def run_webhook_server(automation: ExtendedWorkflowAutomation, port: int):
+    """Serve webhooks and process queued cards one at a time.
+    
+    A single worker thread consumes the queue so git operations on the
+    shared repository stay serialized. A card already waiting in the queue
+    is not queued again, so a burst of events for one card runs it once.
+    """
+    work_queue = queue.Queue()
+    queued = set()
+    queued_lock = threading.Lock()
+    
+    def enqueue(card_id: str):
+        with queued_lock:
+            if card_id in queued:
+                return
+            queued.add(card_id)
+        work_queue.put(card_id)
+    
+    def worker():
+        while True:
+            card_id = work_queue.get()
+            # Events arriving from here on need a new run to be picked up
+            with queued_lock:
+                queued.discard(card_id)
+            try:
+                automation.run_card(card_id)
+            finally:
+                work_queue.task_done()
+    
+    threading.Thread(target=worker, daemon=True).start()
+    
+    WebhookHandler.automation = automation
+    WebhookHandler.enqueue = staticmethod(enqueue)
+    
+    if WEBHOOK_CALLBACK_URL:
+        automation.register_webhooks(WEBHOOK_CALLBACK_URL)
+    
+    server = ThreadingHTTPServer(('', port), WebhookHandler)
+    print(f"Listening for webhooks on port {port}. Press Ctrl+C to stop.")
+    server.serve_forever()
 
 
 def main():
     """Run the workflow once or in a loop."""
     parser = argparse.ArgumentParser(description='Trello and BitBucket automation workflow')
     parser.add_argument('--loop', action='store_true', help='Run in loop mode')
+    parser.add_argument('--webhook', action='store_true', help='Run a webhook receiver instead of polling')
+    parser.add_argument('--port', type=int, default=WEBHOOK_PORT, help='Port for the webhook receiver')
     parser.add_argument('--cleanup', action='store_true', help='Clean up worktrees only')
     parser.add_argument('--debug', action='store_true', help='Enable debug output')
     args = parser.parse_args()
+    if args.cleanup and not (args.webhook or args.loop):
+        # Cleanup only (--webhook and --loop take precedence): nothing talks
+        # to Trello or BitBucket, so the automation is never constructed
+        print("Cleaning up worktrees only...")
+        cleanup_worktrees(force=True)
+        cleanup_old_attachments()
+        return
     
-    # Clean up any orphaned worktrees and old attachments on startup
-    cleanup_worktrees()
-    cleanup_old_attachments()
+    # Clean up any orphaned worktrees and old attachments on startup, while
+    # the card states are being loaded
+    def startup_cleanup():
+        cleanup_worktrees(force=args.cleanup)
+        cleanup_old_attachments()
     
+    cleanup_thread = threading.Thread(target=startup_cleanup, daemon=True)
+    cleanup_thread.start()
     automation = ExtendedWorkflowAutomation(debug=args.debug)
+    cleanup_thread.join()
     
-    if args.loop:
+    if args.webhook:
+        # Catch up on anything missed while the receiver was down
+        automation.run()
+        run_webhook_server(automation, args.port)
+    elif args.loop:
         print("Running in loop mode. Press Ctrl+C to stop.")
-        while True:
-            automation.run()
-            print("\nWaiting 60 seconds before next check...")
-            time.sleep(60)
-    elif args.cleanup:
-        print("Cleaning up worktrees only...")
-        cleanup_worktrees()
+        # SIGUSR1 ends the wait early, so e.g. a git hook or cron job can
+        # ask for an immediate check
+        wake = threading.Event()
+        if hasattr(signal, 'SIGUSR1'):
+            signal.signal(signal.SIGUSR1, lambda signum, frame: wake.set())
+        
+        # Ctrl+C or SIGTERM lets the current run finish and then stops the
+        # loop; a second Ctrl+C stops Claude Code without committing its
+        # changes and abandons the cards not started yet
+        stop = threading.Event()
+        
+        def request_stop(signum, frame):
+            if stop.is_set() and signum == signal.SIGINT:
+                raise KeyboardInterrupt
+            print("\nStopping after the current run...")
+            stop.set()
+            wake.set()
+        
+        signal.signal(signal.SIGINT, request_stop)
+        signal.signal(signal.SIGTERM, request_stop)
+        idle_runs = 0
+        while not stop.is_set():
+            started = time.monotonic()
+            idle_runs = 0 if automation.run() else idle_runs + 1
+            duration = time.monotonic() - started
+            if stop.is_set():
+                break
+            if args.debug:
+                print(f"[DEBUG] Check took {duration:.1f} seconds")
+            interval = next(seconds for min_idle, seconds in reversed(POLL_INTERVALS) if idle_runs >= min_idle)
+            if idle_runs:
+                # A check that found nothing but still took longer than the
+                # interval means Trello or BitBucket is slow; give them at
+                # least as long to recover before asking again
+                interval = max(interval, round(duration))
+            print(f"\nWaiting {interval} seconds before next check...")
+            if wake.wait(interval) and not stop.is_set():
+                print("Woken up for an immediate check")
+            wake.clear()
+        automation.close_claude_sessions()
+        print("Stopped.")
     else:
         automation.run()
 